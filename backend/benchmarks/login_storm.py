@@ -0,0 +1,87 @@
+"""Login storm benchmark.
+
+Fires concurrent logins at a running backend while probing an unrelated
+endpoint, then reports login throughput and the probe's latency
+percentiles. Run it against a server started with different
+PASSWORD_HASH_WORKERS / BCRYPT_ROUNDS settings to compare.
+
+    python benchmarks/login_storm.py --username alice --password secret
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def login_worker(client, args, deadline, results):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.post(
+            "/api/v1/token",
+            json={"username": args.username, "password": args.password},
+        )
+        results.append((response.status_code, time.perf_counter() - start))
+
+
+async def probe_worker(client, args, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get(args.probe_path)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(args.probe_interval)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=60
+    ) as client:
+        logins, probes = [], []
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            probe_worker(client, args, deadline, probes),
+            *[
+                login_worker(client, args, deadline, logins)
+                for _ in range(args.concurrency)
+            ],
+        )
+
+    ok = sum(1 for code, _ in logins if code == 200)
+    login_latencies = [latency for _, latency in logins]
+    print(f"logins: {len(logins)} ({ok} ok) in {args.duration}s")
+    print(f"login throughput: {ok / args.duration:.1f}/s")
+    print(
+        f"login p50/p99: {percentile(login_latencies, 50) * 1000:.1f}ms / "
+        f"{percentile(login_latencies, 99) * 1000:.1f}ms"
+    )
+    print(f"{args.probe_path} samples: {len(probes)}")
+    if probes:
+        print(
+            f"{args.probe_path} mean/p50/p99: "
+            f"{statistics.mean(probes) * 1000:.1f}ms / "
+            f"{percentile(probes, 50) * 1000:.1f}ms / "
+            f"{percentile(probes, 99) * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--probe-path", default="/health/live")
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""Stub code executor.
+
+Answers the executor's ``/execute_code`` and ``/execute_code/stream``
+routes without running anything, after a configurable delay, and can be
+told to fail so the backend's balancing and circuit breaker can be tried
+without the sandbox. Start a few and point the backend at them:
+
+    python benchmarks/stub_executor.py --port 8101 --delay 0.2
+    python benchmarks/stub_executor.py --port 8102 --fail-rate 1
+    CODE_EXECUTOR_URLS=http://localhost:8101,http://localhost:8102 uvicorn main:app
+
+``GET /stats`` reports how many runs each stub has served.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+app = FastAPI(title="Stub Code Executor")
+settings = argparse.Namespace(delay=0.0, fail_rate=0.0)
+stats = {"served": 0, "failed": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+class CodeExecutionRequest(BaseModel):
+    code: str
+
+
+async def fake_run(code: str) -> dict:
+    if random.random() < settings.fail_rate:
+        stats["failed"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Code executor is busy. Try again later.",
+            headers={"Retry-After": "1"},
+        )
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(settings.delay)
+    finally:
+        stats["in_flight"] -= 1
+    stats["served"] += 1
+    return {
+        "result": f"stub ran {len(code)} bytes\n",
+        "returncode": 0,
+        "timed_out": False,
+        "violation": None,
+        "queue_time": 0.0,
+        "run_time": settings.delay,
+    }
+
+
+@app.post("/execute_code")
+async def execute_code(request: CodeExecutionRequest):
+    return await fake_run(request.code)
+
+
+@app.post("/execute_code/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    result = await fake_run(request.code)
+    output = result.pop("result")
+
+    async def events():
+        yield f"event: output\ndata: {json.dumps({'data': output})}\n\n"
+        yield f"event: exit\ndata: {json.dumps(result)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    settings.delay = args.delay
+    settings.fail_rate = args.fail_rate
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
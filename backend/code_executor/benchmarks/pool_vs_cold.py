@@ -0,0 +1,108 @@
+"""Warm worker pool vs cold interpreter benchmark.
+
+Runs the same snippet through ``run_cold`` (the original temp file + fresh
+python3 path), a ``WorkerPool`` with ``size=0`` (fresh sandbox worker per
+run) and a warm ``WorkerPool``, sequentially and with concurrent callers,
+and reports latency percentiles and throughput for each. Run from the
+code_executor directory:
+
+    python -m benchmarks.pool_vs_cold --runs 200 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from worker_pool import WorkerPool
+
+SNIPPET = """
+import math
+total = sum(math.sqrt(i) for i in range(1000))
+print(f"{total:.3f}")
+"""
+
+
+def run_cold(code: str) -> str:
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".py") as temp_script:
+        temp_script.write(code.encode())
+        temp_script_name = temp_script.name
+    try:
+        result = subprocess.run(
+            ["python3", temp_script_name], capture_output=True, text=True, timeout=5
+        )
+        return result.stdout + result.stderr
+    finally:
+        os.remove(temp_script_name)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def measure(run, runs, concurrency):
+    latencies = []
+    remaining = iter(range(runs))
+
+    async def caller():
+        for _ in remaining:
+            start = time.perf_counter()
+            await run()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    return latencies, time.perf_counter() - start
+
+
+def report(name, latencies, elapsed):
+    print(
+        f"{name:>5}: mean/p50/p99 "
+        f"{statistics.mean(latencies) * 1000:.1f}ms / "
+        f"{percentile(latencies, 50) * 1000:.1f}ms / "
+        f"{percentile(latencies, 99) * 1000:.1f}ms, "
+        f"{len(latencies) / elapsed:.1f} runs/s"
+    )
+
+
+async def main(args):
+    fresh = WorkerPool(size=0)
+    pool = WorkerPool(
+        size=args.pool_size,
+        max_runs=args.max_runs,
+        preload=("math",),
+    )
+    await pool.start()
+    try:
+        for concurrency in sorted({1, args.concurrency}):
+            print(f"concurrency {concurrency}, {args.runs} runs")
+            latencies, elapsed = await measure(
+                lambda: asyncio.to_thread(run_cold, SNIPPET), args.runs, concurrency
+            )
+            report("cold", latencies, elapsed)
+            latencies, elapsed = await measure(
+                lambda: fresh.run(SNIPPET), args.runs, concurrency
+            )
+            report("fresh", latencies, elapsed)
+            latencies, elapsed = await measure(
+                lambda: pool.run(SNIPPET), args.runs, concurrency
+            )
+            report("pool", latencies, elapsed)
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--max-runs", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
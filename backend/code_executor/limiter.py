@@ -0,0 +1,57 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+
+class ExecutorBusyError(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ExecutionLimiter:
+    """Caps concurrent executions and the number of callers waiting for one.
+
+    Callers beyond ``max_queue`` are rejected at once; queued callers give
+    up after ``queue_timeout`` seconds. ``slot()`` yields the time spent
+    waiting so it can be reported apart from the run itself.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+        retry_after: int = 1,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.admitted = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def check(self):
+        # counted here rather than from the semaphore, which only changes
+        # once the acquire task gets to run
+        if self.admitted >= self.max_concurrency + self.max_queue:
+            raise ExecutorBusyError("Execution queue is full", self.retry_after)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        started = time.monotonic()
+        self.admitted += 1
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise ExecutorBusyError(
+                    "Timed out waiting for an execution slot", self.retry_after
+                )
+            try:
+                yield time.monotonic() - started
+            finally:
+                self._semaphore.release()
+        finally:
+            self.admitted -= 1
@@ -1,17 +1,77 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import subprocess
-import tempfile
+from typing import List, Optional
+import asyncio
+import json
+import time
 import os
 import re
 
-app = FastAPI(title="Code Executor Service", version="0.1.0")
+from limiter import ExecutionLimiter, ExecutorBusyError
+from worker_pool import WorkerError, WorkerPool
+
+EXECUTION_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT_SECONDS", 5))
+POOL_SIZE = int(os.getenv("EXECUTOR_POOL_SIZE", 4))
+MAX_RUNS_PER_WORKER = int(os.getenv("EXECUTOR_MAX_RUNS_PER_WORKER", 100))
+CPU_LIMIT_SECONDS = int(os.getenv("EXECUTOR_CPU_LIMIT_SECONDS", 5))
+MEMORY_LIMIT_MB = int(os.getenv("EXECUTOR_MEMORY_LIMIT_MB", 256))
+OUTPUT_LIMIT_BYTES = int(os.getenv("EXECUTOR_OUTPUT_LIMIT_BYTES", 1024**2))
+PRELOAD_MODULES = os.getenv(
+    "EXECUTOR_PRELOAD_MODULES",
+    "math,random,re,json,collections,itertools,functools,datetime,string,heapq,bisect",
+)
+MAX_CONCURRENCY = int(
+    os.getenv("EXECUTOR_MAX_CONCURRENCY", 0) or POOL_SIZE or os.cpu_count() or 1
+)
+QUEUE_SIZE = int(os.getenv("EXECUTOR_QUEUE_SIZE", 32))
+QUEUE_TIMEOUT = float(os.getenv("EXECUTOR_QUEUE_TIMEOUT_SECONDS", 10))
+BATCH_MAX_CASES = int(os.getenv("EXECUTOR_BATCH_MAX_CASES", 32))
+BATCH_CONCURRENCY = int(os.getenv("EXECUTOR_BATCH_CONCURRENCY", 0) or MAX_CONCURRENCY)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+worker_pool: WorkerPool | None = None
+execution_limiter: ExecutionLimiter | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global worker_pool, execution_limiter
+    execution_limiter = ExecutionLimiter(
+        MAX_CONCURRENCY, max_queue=QUEUE_SIZE, queue_timeout=QUEUE_TIMEOUT
+    )
+    worker_pool = WorkerPool(
+        size=POOL_SIZE,
+        max_runs=MAX_RUNS_PER_WORKER,
+        timeout=EXECUTION_TIMEOUT,
+        cpu_limit=CPU_LIMIT_SECONDS,
+        memory_limit=MEMORY_LIMIT_MB * 1024**2,
+        output_limit=OUTPUT_LIMIT_BYTES,
+        preload=tuple(name for name in PRELOAD_MODULES.split(",") if name),
+    )
+    await worker_pool.start()
+    yield
+    await worker_pool.stop()
+    worker_pool = None
+
+
+app = FastAPI(title="Code Executor Service", version="0.1.0", lifespan=lifespan)
 
 
 class CodeExecutionRequest(BaseModel):
     code: str
 
 
+class BatchExecutionRequest(BaseModel):
+    """One ``code`` body run once per entry of ``inputs``, or ``snippets``."""
+
+    code: Optional[str] = None
+    inputs: Optional[List[str]] = None
+    snippets: Optional[List[str]] = None
+
+
 FORBIDDEN_KEYWORDS = [
     (r"\bopen\b", "open"),
     (r"\bos\.", "os"),
@@ -28,7 +88,6 @@ FORBIDDEN_KEYWORDS = [
     (r"\beval\b", "eval"),
     (r"\bexec\b", "exec"),
     (r"\bcompile\b", "compile"),
-    (r"\binput\b", "input"),
     (r"\bsys\b", "sys"),
     (r"\bbuiltins\b", "builtins"),
     (r"\bglobals\b", "globals"),
@@ -43,6 +102,27 @@ def is_code_safe(code: str) -> (bool, str):
     return True, ""
 
 
+async def execution_frames(code: str):
+    async with worker_pool.worker() as worker:
+        async for frame in worker.execute(code, EXECUTION_TIMEOUT):
+            yield frame
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def run_code(code: str, stdin: str | None = None) -> dict:
+    try:
+        result = await worker_pool.run(code, stdin)
+    except (WorkerError, OSError) as e:
+        return {"result": f"Error: {str(e)}"}
+    output = result.pop("output")
+    if result["timed_out"]:
+        output = "Error: Code execution timed out."
+    return {"result": output, **result}
+
+
 @app.post("/execute_code")
 async def execute_code(request: CodeExecutionRequest):
     code = request.code
@@ -51,23 +131,128 @@ async def execute_code(request: CodeExecutionRequest):
     if not is_safe:
         raise HTTPException(status_code=400, detail=message)
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".py") as temp_script:
-        temp_script.write(code.encode())
-        temp_script_name = temp_script.name
+    try:
+        async with execution_limiter.slot() as queue_time:
+            started = time.monotonic()
+            result = await run_code(code)
+            run_time = time.monotonic() - started
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    return {**result, "queue_time": queue_time, "run_time": run_time}
+
+
+@app.post("/execute_code/stream")
+async def execute_code_stream(request: CodeExecutionRequest):
+    """Streams output as ``output`` events, then one ``exit`` event.
+
+    A run that cannot be admitted before streaming starts gets a 503; one
+    that fails afterwards ends with an ``error`` event instead.
+    """
+    code = request.code
+
+    is_safe, message = is_code_safe(code)
+    if not is_safe:
+        raise HTTPException(status_code=400, detail=message)
+
+    try:
+        execution_limiter.check()
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    async def events():
+        try:
+            async with execution_limiter.slot() as queue_time:
+                started = time.monotonic()
+                async for frame in execution_frames(code):
+                    if frame["type"] == "output":
+                        yield sse_event("output", {"data": frame["data"]})
+                    else:
+                        result = frame
+                result.pop("type")
+                result["queue_time"] = queue_time
+                result["run_time"] = time.monotonic() - started
+                yield sse_event("exit", result)
+        except (ExecutorBusyError, WorkerError, OSError) as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+def batch_cases(request: BatchExecutionRequest) -> list[tuple[str, str | None]]:
+    if request.snippets is not None:
+        if request.code is not None or request.inputs is not None:
+            raise HTTPException(
+                status_code=400,
+                detail="Send either code with inputs or snippets, not both",
+            )
+        cases = [(snippet, None) for snippet in request.snippets]
+    elif request.code is not None and request.inputs is not None:
+        cases = [(request.code, stdin) for stdin in request.inputs]
+    else:
+        raise HTTPException(
+            status_code=400, detail="Send either code with inputs or snippets"
+        )
+    if not cases:
+        raise HTTPException(status_code=400, detail="At least one case is required")
+    if len(cases) > BATCH_MAX_CASES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch may contain at most {BATCH_MAX_CASES} cases",
+        )
+    return cases
+
+
+async def run_case(index: int, code: str, stdin: str | None, semaphore) -> dict:
+    async with semaphore:
+        try:
+            async with execution_limiter.slot() as queue_time:
+                started = time.monotonic()
+                result = await run_code(code, stdin)
+                run_time = time.monotonic() - started
+        except ExecutorBusyError as e:
+            return {"case": index, "result": f"Error: {str(e)}"}
+    return {"case": index, **result, "queue_time": queue_time, "run_time": run_time}
+
+
+@app.post("/execute_code/batch")
+async def execute_code_batch(request: BatchExecutionRequest):
+    """Runs every case of a batch, ``BATCH_CONCURRENCY`` at a time.
+
+    Each case takes its own execution slot, so a batch shares the executor
+    fairly with single runs. Results come back in the order of the cases.
+    """
+    cases = batch_cases(request)
+    for code in {code for code, _ in cases}:
+        is_safe, message = is_code_safe(code)
+        if not is_safe:
+            raise HTTPException(status_code=400, detail=message)
 
     try:
-        result = subprocess.run(
-            ["python3", temp_script_name],
-            capture_output=True,
-            text=True,
-            timeout=5,  # Timeout to prevent long-running scripts
+        execution_limiter.check()
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
         )
-        output = result.stdout + result.stderr
-    except subprocess.TimeoutExpired:
-        output = "Error: Code execution timed out."
-    except Exception as e:
-        output = f"Error: {str(e)}"
-    finally:
-        os.remove(temp_script_name)
 
-    return {"result": output}
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    results = await asyncio.gather(
+        *[
+            run_case(index, code, stdin, semaphore)
+            for index, (code, stdin) in enumerate(cases)
+        ]
+    )
+    return {"results": results, "wall_time": time.monotonic() - started}
@@ -0,0 +1,301 @@
+"""Warm sandbox worker for the code executor.
+
+Started by ``WorkerPool`` with its stdin and stdout connected to the pool.
+Modules listed in ``--preload`` are imported once at startup. Each request
+line ``{"code": ...}`` is compiled here and run in a forked child under
+CPU and address-space rlimits, so a run pays neither interpreter startup
+nor a disk write. Output is relayed back as JSON lines,
+``{"type": "output", "data": ...}`` chunks followed by one
+``{"type": "exit", ...}`` frame. Only the first and last halves of
+``--output-limit`` bytes are kept; the head is relayed as it arrives and
+the tail once the run ends. A request may carry ``"stdin"``, which is fed
+to the child through a pipe; otherwise its stdin is ``/dev/null``.
+Compiled code objects are cached, so a batch of cases sharing one body
+compiles it once per worker.
+"""
+
+import argparse
+import builtins
+import codecs
+import ctypes
+import functools
+import importlib
+import json
+import linecache
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import traceback
+
+MEMORY_EXIT_CODE = 137
+PR_SET_PDEATHSIG = 1
+READ_SIZE = 65536
+COMPILE_CACHE_SIZE = 32
+
+
+def send(frame: dict):
+    sys.stdout.write(json.dumps(frame) + "\n")
+    sys.stdout.flush()
+
+
+def preload(modules: list[str]):
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Could not preload {name}: {e}", file=sys.stderr)
+
+
+@functools.lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_code(code: str):
+    return compile(code, "<code>", "exec")
+
+
+def die_with_parent(parent_pid: int):
+    """Has the kernel kill this process when the worker that forked it dies.
+
+    The child runs in a session of its own, so killing the worker would
+    otherwise leave it running, and a sleeping child never hits its CPU
+    limit.
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL) != 0:
+        print("Could not tie the run to its worker", file=sys.stderr)
+    # the worker may have died before the signal was armed
+    if os.getppid() != parent_pid:
+        os._exit(1)
+
+
+def run_child(
+    code_obj,
+    write_fd: int,
+    stdin_fd: int | None,
+    cpu_limit: int,
+    memory_limit: int,
+    parent_pid: int,
+):
+    os.setsid()
+    die_with_parent(parent_pid)
+    if stdin_fd is None:
+        stdin_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(stdin_fd, 0)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(stdin_fd)
+    os.close(write_fd)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_limit, cpu_limit + 1))
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    status = 0
+    try:
+        exec(code_obj, {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except MemoryError as e:
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = MEMORY_EXIT_CODE
+    except BaseException as e:
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        status = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(status)
+
+
+class OutputRelay:
+    """Relays the head of a run's output live and keeps a bounded tail."""
+
+    def __init__(self, limit: int):
+        self.head_left = limit // 2 if limit else sys.maxsize
+        self.tail_limit = limit - limit // 2
+        self.tail = bytearray()
+        self.total = 0
+        self.dropped = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def feed(self, data: bytes):
+        self.total += len(data)
+        if self.head_left > 0:
+            head, data = data[: self.head_left], data[self.head_left :]
+            self.head_left -= len(head)
+            text = self.decoder.decode(head)
+            if text:
+                send({"type": "output", "data": text})
+        if data:
+            self.tail += data
+            excess = len(self.tail) - self.tail_limit
+            if excess > 0:
+                self.dropped += excess
+                del self.tail[:excess]
+
+    def finish(self):
+        if self.dropped:
+            text = self.decoder.decode(b"", final=True)
+            text += f"\n... [{self.dropped} bytes truncated] ...\n"
+            text += self.tail.decode(errors="replace")
+        else:
+            text = self.decoder.decode(bytes(self.tail), final=True)
+        if text:
+            send({"type": "output", "data": text})
+
+
+def relay_output(
+    read_fd: int,
+    deadline: float,
+    relay: OutputRelay,
+    stdin_fd: int | None = None,
+    stdin_data: bytes = b"",
+) -> bool:
+    """Feeds the child's output to ``relay`` until EOF; False on timeout.
+
+    ``stdin_data`` is written to ``stdin_fd`` as the child reads it, so a
+    child that prints before reading all of its input cannot deadlock.
+    """
+    if stdin_fd is not None:
+        os.set_blocking(stdin_fd, False)
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            writers = [stdin_fd] if stdin_fd is not None else []
+            ready, writable, _ = select.select([read_fd], writers, [], remaining)
+            if not ready and not writable:
+                return False
+            if writable:
+                try:
+                    written = os.write(stdin_fd, stdin_data[:READ_SIZE])
+                except BlockingIOError:
+                    written = 0
+                except BrokenPipeError:
+                    # the child closed its stdin without reading everything
+                    written = len(stdin_data)
+                stdin_data = stdin_data[written:]
+                if not stdin_data:
+                    os.close(stdin_fd)
+                    stdin_fd = None
+            if ready:
+                data = os.read(read_fd, READ_SIZE)
+                if not data:
+                    return True
+                relay.feed(data)
+    finally:
+        if stdin_fd is not None:
+            os.close(stdin_fd)
+
+
+def handle(request: dict, args):
+    started = time.monotonic()
+    code = request["code"]
+    # lets tracebacks show source lines as they would for a script file
+    linecache.cache["<code>"] = (len(code), None, code.splitlines(True), "<code>")
+    try:
+        code_obj = compile_code(code)
+    except (SyntaxError, ValueError) as e:
+        send({"type": "output", "data": "".join(traceback.format_exception_only(e))})
+        send(
+            {
+                "type": "exit",
+                "returncode": 1,
+                "timed_out": False,
+                "violation": None,
+                "cpu_time": 0.0,
+                "max_rss": 0,
+                "wall_time": time.monotonic() - started,
+                "output_bytes": 0,
+                "truncated": False,
+            }
+        )
+        return
+
+    stdin = request.get("stdin")
+    stdin_read = stdin_write = None
+    if stdin is not None:
+        stdin_read, stdin_write = os.pipe()
+    read_fd, write_fd = os.pipe()
+    parent_pid = os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        if stdin_write is not None:
+            os.close(stdin_write)
+        run_child(
+            code_obj,
+            write_fd,
+            stdin_read,
+            args.cpu_limit,
+            args.memory_limit,
+            parent_pid,
+        )
+    os.close(write_fd)
+    if stdin_read is not None:
+        os.close(stdin_read)
+
+    relay = OutputRelay(args.output_limit)
+    deadline = started + request.get("timeout", args.timeout)
+    finished = relay_output(
+        read_fd, deadline, relay, stdin_write, (stdin or "").encode()
+    )
+    if not finished:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status, usage = os.wait4(pid, 0)
+    os.close(read_fd)
+    relay.finish()
+
+    returncode = os.waitstatus_to_exitcode(status)
+    violation = None
+    if not finished:
+        violation = "timeout"
+    elif returncode in (-signal.SIGXCPU, -signal.SIGKILL):
+        violation = "cpu"
+    elif returncode == MEMORY_EXIT_CODE:
+        violation = "memory"
+    send(
+        {
+            "type": "exit",
+            "returncode": returncode,
+            "timed_out": not finished,
+            "violation": violation,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "max_rss": usage.ru_maxrss * 1024,
+            "wall_time": time.monotonic() - started,
+            "output_bytes": relay.total,
+            "truncated": relay.dropped > 0,
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--cpu-limit", type=int, default=5)
+    parser.add_argument("--memory-limit", type=int, default=256 * 1024**2)
+    parser.add_argument("--output-limit", type=int, default=1024**2)
+    parser.add_argument("--preload", default="")
+    args = parser.parse_args()
+
+    preload([name for name in args.preload.split(",") if name])
+    send({"type": "ready", "pid": os.getpid()})
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if line.strip():
+            handle(json.loads(line), args)
+
+
+if __name__ == "__main__":
+    main()
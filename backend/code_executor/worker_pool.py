@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+WORKER_SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py"
+)
+# Extra time the pool waits for a worker beyond the run timeout it enforces
+WORKER_GRACE_SECONDS = 2.0
+SPAWN_TIMEOUT_SECONDS = 30.0
+# JSON-escaping can grow output six-fold ("\u0001"); frames carry at most
+# half the output limit, or one worker read when output is unlimited
+FRAME_ESCAPE_FACTOR = 6
+WORKER_READ_SIZE = 65536
+FRAME_SLACK = 64 * 1024
+
+
+def frame_limit(output_limit: int) -> int:
+    return FRAME_ESCAPE_FACTOR * max(output_limit, WORKER_READ_SIZE) + FRAME_SLACK
+
+
+class WorkerError(Exception):
+    pass
+
+
+class SandboxWorker:
+    def __init__(self, process):
+        self.process = process
+        self.runs = 0
+        self.broken = False
+
+    @classmethod
+    async def spawn(cls, args: list[str], output_limit: int = 1024**2):
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-u",
+            WORKER_SCRIPT,
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=frame_limit(output_limit),
+        )
+        worker = cls(process)
+        try:
+            frame = await worker._read_frame(SPAWN_TIMEOUT_SECONDS)
+        except WorkerError:
+            await worker.close()
+            raise
+        if frame["type"] != "ready":
+            await worker.close()
+            raise WorkerError(f"Unexpected frame from new worker: {frame}")
+        return worker
+
+    async def execute(self, code: str, timeout: float, stdin: str | None = None):
+        """Yields ``output`` frames followed by the ``exit`` frame of one run."""
+        self.runs += 1
+        finished = False
+        try:
+            request = {"code": code, "timeout": timeout}
+            if stdin is not None:
+                request["stdin"] = stdin
+            self.process.stdin.write((json.dumps(request) + "\n").encode())
+            await self.process.stdin.drain()
+            deadline = asyncio.get_running_loop().time() + timeout
+            deadline += WORKER_GRACE_SECONDS
+            while True:
+                frame = await self._read_frame(
+                    deadline - asyncio.get_running_loop().time()
+                )
+                if frame["type"] == "exit":
+                    finished = True
+                    if frame["violation"]:
+                        self.broken = True
+                yield frame
+                if finished:
+                    return
+        except (ConnectionError, BrokenPipeError) as e:
+            raise WorkerError(f"Worker pipe closed: {e}")
+        finally:
+            # a run abandoned halfway leaves frames in the pipe
+            if not finished:
+                self.broken = True
+
+    async def _read_frame(self, timeout: float):
+        try:
+            line = await asyncio.wait_for(self.process.stdout.readline(), timeout)
+        except asyncio.TimeoutError:
+            self.broken = True
+            raise WorkerError("Worker stopped responding")
+        except (ValueError, asyncio.LimitOverrunError) as e:
+            # an oversized frame leaves the rest of it in the pipe
+            self.broken = True
+            raise WorkerError(f"Unreadable frame from worker: {e}")
+        if not line:
+            self.broken = True
+            raise WorkerError("Worker exited unexpectedly")
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            self.broken = True
+            raise WorkerError(f"Unreadable frame from worker: {e}")
+
+    async def close(self):
+        if self.process.returncode is None:
+            self.process.kill()
+        await self.process.wait()
+
+
+class WorkerPool:
+    """Pre-forked sandbox workers with the interpreter and preloads warm.
+
+    A worker is replaced in the background after ``max_runs`` runs, after
+    any rlimit or timeout violation, or when it stops responding. With
+    ``size=0`` every run gets a freshly started worker instead.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        max_runs: int = 100,
+        timeout: float = 5.0,
+        cpu_limit: int = 5,
+        memory_limit: int = 256 * 1024**2,
+        output_limit: int = 1024**2,
+        preload: tuple[str, ...] = (),
+    ):
+        self.size = size
+        self.max_runs = max_runs
+        self.timeout = timeout
+        self.cpu_limit = cpu_limit
+        self.memory_limit = memory_limit
+        self.output_limit = output_limit
+        self.preload = preload
+        self._idle = asyncio.Queue()
+        self._workers = set()
+        self._tasks = set()
+        self._stopping = False
+
+    def _worker_args(self):
+        return [
+            "--timeout",
+            str(self.timeout),
+            "--cpu-limit",
+            str(self.cpu_limit),
+            "--memory-limit",
+            str(self.memory_limit),
+            "--output-limit",
+            str(self.output_limit),
+            "--preload",
+            ",".join(self.preload if self.size else ()),
+        ]
+
+    async def start(self):
+        workers = await asyncio.gather(
+            *[
+                SandboxWorker.spawn(self._worker_args(), self.output_limit)
+                for _ in range(self.size)
+            ]
+        )
+        for worker in workers:
+            self._workers.add(worker)
+            self._idle.put_nowait(worker)
+
+    async def stop(self):
+        self._stopping = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*[worker.close() for worker in self._workers])
+        self._workers.clear()
+
+    @asynccontextmanager
+    async def worker(self):
+        if not self.size:
+            worker = await SandboxWorker.spawn(self._worker_args(), self.output_limit)
+            try:
+                yield worker
+            finally:
+                await worker.close()
+            return
+        worker = await self._idle.get()
+        try:
+            yield worker
+        finally:
+            self._release(worker)
+
+    def _release(self, worker: SandboxWorker):
+        if (
+            worker.broken
+            or worker.runs >= self.max_runs
+            or worker.process.returncode is not None
+        ):
+            self._workers.discard(worker)
+            task = asyncio.create_task(self._replace(worker))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._idle.put_nowait(worker)
+
+    async def _replace(self, worker: SandboxWorker):
+        await worker.close()
+        while not self._stopping:
+            try:
+                new_worker = await SandboxWorker.spawn(
+                    self._worker_args(), self.output_limit
+                )
+            except (OSError, WorkerError) as e:
+                print(f"Failed to start sandbox worker, retrying: {e}")
+                await asyncio.sleep(1)
+                continue
+            self._workers.add(new_worker)
+            self._idle.put_nowait(new_worker)
+            return
+
+    async def run(self, code: str, stdin: str | None = None) -> dict:
+        output = []
+        result = {}
+        async with self.worker() as worker:
+            async for frame in worker.execute(code, self.timeout, stdin):
+                if frame["type"] == "output":
+                    output.append(frame["data"])
+                else:
+                    result = frame
+        result.pop("type", None)
+        return {"output": "".join(output), **result}
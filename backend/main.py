@@ -1,91 +1,394 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 from typing import Annotated
 import aioredis
-from repositories.database import engine
-from sqlalchemy.orm import Session
-from fastapi import Depends, FastAPI, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, status
 from fastapi.responses import JSONResponse
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv, find_dotenv
 import os
 from routers import users, chats, code_editor, items
-from repositories import models, schemas, auths, crud
-from repositories.database import get_db
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from repositories import schemas, auths, async_crud
+from repositories.database import get_async_db, SessionLocal
+from repositories.scheduler import BatchScheduler, QueueFullError
+from repositories.prefix_cache import PrefixCache, common_prefix_length
+from repositories.conversation_cache import ConversationCache
+from repositories.backends import InferenceBackend, get_backend
+from repositories.persistence import ChatPersistenceQueue
+from repositories import rate_limit, principal_cache, executor_client, sse
+from repositories import response_cache
+from repositories.response_cache import CachedResponse, SingleFlight, normalize
+from repositories.rate_limit import RateLimiter
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from contextlib import asynccontextmanager
-from threading import Thread
 import humanize
 from datetime import timedelta
 import asyncio
+import functools
+import json
+import uuid
+import pytz
 
 load_dotenv(find_dotenv())
 
-models.Base.metadata.create_all(bind=engine)
-
 model_checkpoint_path = "./meta-llama/Meta-Llama-3.1-8B-Instruct"
+max_batch_size = int(os.getenv("MAX_BATCH_SIZE", 8))
+max_queue_size = int(os.getenv("GENERATION_QUEUE_SIZE", 64))
+max_new_tokens_cap = int(os.getenv("MAX_NEW_TOKENS_CAP", 4096))
+max_prompt_tokens = int(os.getenv("MAX_PROMPT_TOKENS", 8192))
+queue_retry_after = int(os.getenv("GENERATION_RETRY_AFTER_SECONDS", 5))
+prefix_cache_max_bytes = int(os.getenv("PREFIX_CACHE_MAX_BYTES", 1024**3))
+prefix_cache_min_tokens = int(os.getenv("PREFIX_CACHE_MIN_TOKENS", 32))
+conversation_cache_max_bytes = int(
+    os.getenv("CONVERSATION_CACHE_MAX_BYTES", 2 * 1024**3)
+)
+conversation_cache_host_max_bytes = int(
+    os.getenv("CONVERSATION_CACHE_HOST_MAX_BYTES", 0)
+)
+conversation_cache_idle_seconds = float(
+    os.getenv("CONVERSATION_CACHE_IDLE_SECONDS", 600)
+)
+warmup_prompt = os.getenv("WARMUP_PROMPT", "Hello")
+warmup_max_new_tokens = int(os.getenv("WARMUP_MAX_NEW_TOKENS", 8))
+# target checkpoint -> {"draft": draft checkpoint, "num_tokens": proposals per step}
+speculative_draft_models = json.loads(os.getenv("SPECULATIVE_DRAFT_MODELS", "{}"))
+chat_context_tokens = int(os.getenv("CHAT_CONTEXT_TOKENS", 4096))
+chat_context_max_messages = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", 100))
+# chat template tokens around each message's content, e.g. role headers
+MESSAGE_OVERHEAD_TOKENS = 8
+response_cache_enabled = os.getenv("RESPONSE_CACHE_ENABLED", "false") == "true"
+response_cache_max_temperature = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", 0.2))
+response_cache_scope = os.getenv("RESPONSE_CACHE_SCOPE", "global")
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+persistence_queue = ChatPersistenceQueue(
+    SessionLocal,
+    batch_size=int(os.getenv("CHAT_PERSIST_BATCH_SIZE", 50)),
+    flush_interval=float(os.getenv("CHAT_PERSIST_FLUSH_SECONDS", 1.0)),
+    spool_path=os.getenv("CHAT_PERSIST_SPOOL_PATH", "chat_spool.jsonl"),
+)
 
 
 class ChatModel:
-    def __init__(self, model_checkpoint: str):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_checkpoint, torch_dtype=torch.bfloat16, device_map="cuda"
+    def __init__(self, model_checkpoint: str, backend: InferenceBackend = None):
+        backend = backend or get_backend()
+        self.model, self.tokenizer = backend.load(model_checkpoint)
+        self.draft_checkpoint, draft_model, num_draft_tokens = self._load_draft(
+            backend, model_checkpoint
         )
+        self.scheduler = BatchScheduler(
+            self.model,
+            self.tokenizer,
+            device=backend.device,
+            max_batch_size=max_batch_size,
+            max_queue_size=max_queue_size,
+            retry_after=queue_retry_after,
+            prefix_cache=PrefixCache(
+                max_bytes=prefix_cache_max_bytes, min_tokens=prefix_cache_min_tokens
+            ),
+            conversation_cache=ConversationCache(
+                max_bytes=conversation_cache_max_bytes,
+                idle_seconds=conversation_cache_idle_seconds,
+                host_max_bytes=conversation_cache_host_max_bytes,
+                min_tokens=prefix_cache_min_tokens,
+            ),
+            draft_model=draft_model,
+            num_draft_tokens=num_draft_tokens,
+        )
+        self._system_prefix_ids = functools.lru_cache(maxsize=128)(
+            self._system_prefix_ids
+        )
+        # generation id -> (user id, GenerationStream) while it is running
+        self.generations = {}
+        self.single_flight = SingleFlight(on_finished=self._cache_response)
+
+    def _load_draft(self, backend: InferenceBackend, model_checkpoint: str):
+        pair = speculative_draft_models.get(model_checkpoint)
+        if not pair:
+            return None, None, 0
+        draft_model, draft_tokenizer = backend.load_draft(pair["draft"])
+        if draft_tokenizer.vocab_size != self.tokenizer.vocab_size:
+            print(
+                f"Draft model {pair['draft']} does not share the vocabulary of "
+                f"{model_checkpoint}; speculative decoding is off"
+            )
+            return None, None, 0
+        return pair["draft"], draft_model, int(pair.get("num_tokens", 4))
+
+    def speculation_stats(self):
+        scheduler = self.scheduler
+        return {
+            "draft_model": self.draft_checkpoint,
+            "proposed": scheduler.draft_proposed,
+            "accepted": scheduler.draft_accepted,
+            "acceptance_rate": scheduler.draft_acceptance_rate,
+        }
+
+    def warm_up(self, prompt: str, max_new_tokens: int):
+        messages = [{"role": "user", "content": prompt}]
+        input_ids = self.tokenizer.apply_chat_template(
+            messages, tokenize=True, add_generation_prompt=True
+        )
+        for _ in self.scheduler.submit(
+            input_ids, max_new_tokens=max_new_tokens, do_sample=False
+        ):
+            pass
+
+    def _system_prefix_ids(self, system_prompt: str):
+        messages = [{"role": "user", "content": f"{system_prompt} "}]
+        return self.tokenizer.apply_chat_template(messages, tokenize=True)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def select_history(self, turns: list[tuple[str, str, int]], budget: int):
+        """Keeps the newest ``(sender, content, tokens)`` turns that fit ``budget``.
+
+        The kept history always starts with a user message.
+        """
+        selected = []
+        used = 0
+        for sender, content, tokens in reversed(turns):
+            used += tokens + MESSAGE_OVERHEAD_TOKENS
+            if used > budget:
+                break
+            selected.append((sender, content))
+        selected.reverse()
+        while selected and selected[0][0] != "user":
+            selected.pop(0)
+        return selected
 
     def generate_text(
         self,
         prompt: str,
         system_prompt: str,
         user_id: int,
-        db: Session = Depends(get_db),
+        generation_id: str,
+        history: list[tuple[str, str]] = (),
+        chat_id: int | None = None,
+        max_new_tokens: int = 512,
+        temperature: float = 0.1,
+        top_p: float = 0.9,
+    ):
+        streamer = self._submit(
+            prompt,
+            system_prompt,
+            history,
+            chat_id,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+        )
+        self.generations[generation_id] = (user_id, streamer)
+        return self._stream_response(streamer, prompt, user_id, generation_id, chat_id)
+
+    def generate_cached(
+        self,
+        prompt: str,
+        system_prompt: str,
+        user_id: int,
+        generation_id: str,
+        max_new_tokens: int = 512,
+        temperature: float = 0.1,
+        top_p: float = 0.9,
+    ):
+        """Like ``generate_text``, through the response cache.
+
+        A cached or similar enough earlier answer is replayed without the
+        model, and concurrent requests for the same prompt share one
+        generation. Returns the text stream and ``hit``, ``shared`` or
+        ``miss``.
+        """
+        max_new_tokens = min(max_new_tokens, max_new_tokens_cap)
+        scope = user_id if response_cache_scope == "user" else None
+        group = (scope, normalize(system_prompt), max_new_tokens)
+        cached = response_cache.response_cache.lookup(group, prompt)
+        if cached is not None:
+            streamer, state = CachedResponse(*cached), "hit"
+        else:
+            streamer, shared = self.single_flight.join(
+                (group, normalize(prompt)),
+                lambda: self._submit(
+                    prompt,
+                    system_prompt,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                ),
+            )
+            state = "shared" if shared else "miss"
+        self.generations[generation_id] = (user_id, streamer)
+        return (
+            self._stream_response(streamer, prompt, user_id, generation_id, None),
+            state,
+        )
+
+    def _cache_response(self, key, text: str, generated_ids: list[int]):
+        group, prompt = key
+        response_cache.response_cache.store(group, prompt, text, generated_ids)
+
+    def _submit(
+        self,
+        prompt: str,
+        system_prompt: str,
+        history: list[tuple[str, str]] = (),
+        chat_id: int | None = None,
+        max_new_tokens: int = 512,
+        temperature: float = 0.1,
+        top_p: float = 0.9,
     ):
-        complete_prompt = f"{system_prompt} {prompt}"
-        messages = [{"role": "user", "content": complete_prompt}]
-        inputs = self.tokenizer.apply_chat_template(
+        messages = [
+            {"role": "user" if sender == "user" else "assistant", "content": content}
+            for sender, content in [*history, ("user", prompt)]
+        ]
+        # the system prompt leads the first turn, so its KV prefix stays cacheable
+        messages[0]["content"] = f"{system_prompt} {messages[0]['content']}"
+        input_ids = self.tokenizer.apply_chat_template(
             messages,
-            return_dict=True,
             tokenize=True,
             add_generation_prompt=True,
-            return_tensors="pt",
-        ).to("cuda")
-        streamer = TextIteratorStreamer(
-            self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=None
         )
-        generation_kwargs = dict(
-            inputs, streamer=streamer, max_new_tokens=128000, do_sample=True
+        if len(input_ids) > max_prompt_tokens:
+            raise ValueError(
+                f"Prompt is {len(input_ids)} tokens, the limit is {max_prompt_tokens}"
+            )
+        prefix_len = common_prefix_length(
+            input_ids, self._system_prefix_ids(system_prompt)
+        )
+        return self.scheduler.submit(
+            input_ids,
+            max_new_tokens=min(max_new_tokens, max_new_tokens_cap),
+            temperature=temperature,
+            top_p=top_p,
+            do_sample=temperature > 0,
+            prefix_len=prefix_len,
+            cache_key=chat_id,
         )
-        thread = Thread(target=self.model.generate, kwargs=generation_kwargs)
-        thread.start()
-        complete_response = ""
-        for new_text in streamer:
-            complete_response += new_text
-            yield new_text
-        chat = crud.create_chat(db, user_id=user_id)
-        crud.create_message(db, chat_id=chat.id, sender="user", content=prompt)
-        crud.create_message(
-            db, chat_id=chat.id, sender="bot", content=complete_response
+
+    def cancel(self, generation_id: str, user_id: int | None = None) -> bool:
+        """Stops a running generation; only its owner may when ``user_id`` is given."""
+        generation = self.generations.get(generation_id)
+        if generation is None or user_id not in (None, generation[0]):
+            return False
+        self.generations.pop(generation_id, None)
+        generation[1].cancel()
+        return True
+
+    def _stream_response(
+        self,
+        streamer,
+        prompt: str,
+        user_id: int,
+        generation_id: str,
+        chat_id: int | None,
+    ):
+        started_at = datetime.now(pytz.timezone("Asia/Tokyo"))
+        parts = []
+        try:
+            for new_text in streamer:
+                parts.append(new_text)
+                yield new_text
+        finally:
+            self.generations.pop(generation_id, None)
+        persistence_queue.enqueue(
+            user_id,
+            prompt,
+            "".join(parts),
+            started_at=started_at,
+            finished_at=datetime.now(pytz.timezone("Asia/Tokyo")),
+            chat_id=chat_id,
+            prompt_tokens=self.count_tokens(prompt),
+            response_tokens=len(streamer.generated_ids),
         )
 
 
 chat_model = None
 ai_models = {}
+model_status = {"state": "loading", "error": None}
 
 redis_url = os.getenv("REDIS_URL")
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
+def load_chat_model():
     global chat_model
-    chat_model = ChatModel(model_checkpoint=model_checkpoint_path)
+    try:
+        if response_cache_enabled:
+            response_cache.init(
+                embedding_model=os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL"),
+                max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 10000)),
+                ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", 3600)),
+                similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.95)),
+            )
+        model = ChatModel(model_checkpoint=model_checkpoint_path)
+        model_status["state"] = "warming_up"
+        if warmup_max_new_tokens > 0:
+            model.warm_up(warmup_prompt, warmup_max_new_tokens)
+    except Exception as e:
+        print(f"Failed to load chat model: {e}")
+        model_status.update(state="failed", error=str(e))
+        return
+    chat_model = model
     ai_models["chat_model"] = chat_model
-    redis = aioredis.from_url(redis_url, encoding="utf8", decode_responses=True)
-    await FastAPILimiter.init(redis)
+    model_status["state"] = "ready"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    model_loader = asyncio.create_task(asyncio.to_thread(load_chat_model))
+    persistence_queue.start()
+    redis = aioredis.from_url(
+        redis_url,
+        encoding="utf8",
+        decode_responses=True,
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+    )
+    rate_limit.init(
+        redis,
+        local_rate=float(os.getenv("RATE_LIMIT_LOCAL_RATE", 0)),
+        local_burst=float(os.getenv("RATE_LIMIT_LOCAL_BURST", 0)),
+    )
+    principal_cache.init(
+        backend=os.getenv("PRINCIPAL_CACHE_BACKEND", "memory"),
+        redis=redis,
+        ttl=int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30)),
+        max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000)),
+    )
+    executor_client.init(
+        urls=[
+            url.strip()
+            for url in os.getenv(
+                "CODE_EXECUTOR_URLS", executor_client.DEFAULT_EXECUTOR_URL
+            ).split(",")
+            if url.strip()
+        ],
+        connect_timeout=float(os.getenv("CODE_EXECUTOR_CONNECT_TIMEOUT_SECONDS", 5)),
+        read_timeout=float(os.getenv("CODE_EXECUTOR_READ_TIMEOUT_SECONDS", 60)),
+        max_connections=int(os.getenv("CODE_EXECUTOR_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(
+            os.getenv("CODE_EXECUTOR_MAX_KEEPALIVE_CONNECTIONS", 20)
+        ),
+        failure_threshold=int(os.getenv("CODE_EXECUTOR_BREAKER_FAILURES", 5)),
+        reset_timeout=float(os.getenv("CODE_EXECUTOR_BREAKER_RESET_SECONDS", 30)),
+    )
+    sse.init(
+        backend=os.getenv("GENERATION_REPLAY_BACKEND", "memory"),
+        redis=redis,
+        ttl=int(os.getenv("GENERATION_REPLAY_TTL_SECONDS", 300)),
+        window=float(os.getenv("SSE_COALESCE_MS", 50)) / 1000,
+        max_bytes=int(os.getenv("SSE_COALESCE_BYTES", 512)),
+        orphan_timeout=float(os.getenv("GENERATION_ORPHAN_TIMEOUT_SECONDS", 30)),
+    )
     yield
+    await sse.publisher.stop()
+    await executor_client.close()
+    await redis.close()
+    if chat_model is not None:
+        chat_model.scheduler.shutdown()
+    if not model_loader.done():
+        print("Shutting down while the chat model is still loading")
+    persistence_queue.stop()
     ai_models.clear()
 
 
@@ -100,13 +403,19 @@ app.add_middleware(
 )
 
 
+def format_time(seconds):
+    return humanize.precisedelta(timedelta(seconds=seconds), minimum_unit="seconds")
+
+
 @app.exception_handler(HTTPException)
 async def custom_http_exception_handler(request, exc):
-    headers = {"Access-Control-Allow-Origin": "*"}
+    headers = {"Access-Control-Allow-Origin": "*", **(exc.headers or {})}
     if exc.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+        time_left = format_time(int(headers.get("Retry-After", 0)))
+        print(f"Time left to reset rate limit: {time_left}")
         return JSONResponse(
             status_code=exc.status_code,
-            content={"detail": exc.detail},
+            content={"error": exc.detail, "time_left": time_left},
             headers=headers,
         )
     elif exc.status_code == status.HTTP_401_UNAUTHORIZED:
@@ -129,49 +438,39 @@ async def custom_http_exception_handler(request, exc):
 
 
 @app.middleware("http")
-async def rate_limit_middleware(request: Request, call_next):
-    redis = aioredis.from_url(redis_url, encoding="utf8", decode_responses=True)
-    ip = request.client.host
-    endpoint = request.url.path
-    key = f"cooldown:{ip}:{endpoint}"
-
-    cooldown_expiry = await redis.ttl(key)
-
-    def format_time(seconds):
-        return humanize.precisedelta(timedelta(seconds=seconds), minimum_unit="seconds")
-
-    if cooldown_expiry > 0:
-        time_left = format_time(cooldown_expiry)
-        print(f"Time left to reset rate limit: {time_left}")
-        return JSONResponse(
-            status_code=429,
-            content={
-                "error": "Rate limit exceeded. Try again later.",
-                "time_left": time_left,
-            },
-            headers={"Access-Control-Allow-Origin": "*"},
-        )
-
+async def access_control_middleware(request: Request, call_next):
     response = await call_next(request)
-
-    if response.status_code == 429:
-        await redis.set(key, 1, ex=3 * 60)
-        cooldown_expiry = await redis.ttl(key)
-        time_left = format_time(cooldown_expiry)
-        print(f"Time left to reset rate limit: {time_left}")
-        return JSONResponse(
-            status_code=429,
-            content={
-                "error": "Rate limit exceeded. Try again later.",
-                "time_left": time_left,
-            },
-            headers={"Access-Control-Allow-Origin": "*"},
-        )
-
     response.headers["Access-Control-Allow-Origin"] = "*"
     return response
 
 
+async def load_chat_history(db: AsyncSession, chat_id: int, budget: int):
+    """The chat's latest turns that fit ``budget`` tokens, oldest first.
+
+    Messages stored before token counts were recorded are counted once and
+    the counts written back; turns still waiting in the persistence queue
+    are included so quick follow-ups see them.
+    """
+    rows = await async_crud.get_recent_messages(db, chat_id, chat_context_max_messages)
+    rows.reverse()
+    uncounted = [(row.id, row.content) for row in rows if row.token_count is None]
+    missing = await run_in_threadpool(
+        lambda: {
+            message_id: chat_model.count_tokens(content)
+            for message_id, content in uncounted
+        }
+    )
+    if missing:
+        await async_crud.set_message_token_counts(db, missing)
+    turns = [
+        (row.sender, row.content, missing.get(row.id, row.token_count)) for row in rows
+    ]
+    for record in persistence_queue.pending_turns(chat_id):
+        turns.append(("user", record["prompt"], record["prompt_tokens"]))
+        turns.append(("bot", record["response"], record["response_tokens"]))
+    return chat_model.select_history(turns, budget)
+
+
 @app.post(
     "/api/v1/generate/",
     dependencies=[Depends(RateLimiter(times=15, minutes=10))],
@@ -179,23 +478,175 @@ async def rate_limit_middleware(request: Request, call_next):
 )
 async def generate(
     request: Request,
+    chat_request: schemas.ChatRequest,
     current_user: Annotated[schemas.User, Depends(auths.get_current_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """Streams the reply as plain text, or as server-sent events.
+
+    With a ``chat_id`` the reply continues that chat: its latest messages,
+    up to ``CHAT_CONTEXT_TOKENS``, are sent ahead of the prompt and the new
+    turn is stored in the chat.
+
+    Clients that accept ``text/event-stream`` get a ``start`` event with the
+    generation id, ``token`` events with coalesced text and a final ``done``
+    or ``error`` event. Every event has an id, and a dropped client can
+    resume from ``/api/v1/generate/{generation_id}/events``.
+    """
     print(f"Current user: {current_user}")
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated"
         )
-    data = await request.json()
-    prompt = data["prompt"]
-    system_prompt = data["system_prompt"]
+    if chat_model is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Chat model is not ready ({model_status['state']}).",
+            headers={"Retry-After": str(queue_retry_after)},
+        )
+    history = []
+    if chat_request.chat_id is not None:
+        owner = await async_crud.get_chat_owner(db, chat_request.chat_id)
+        if owner != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Chat not found"
+            )
+        budget = min(
+            chat_context_tokens,
+            max_prompt_tokens
+            - await run_in_threadpool(
+                chat_model.count_tokens,
+                f"{chat_request.system_prompt} {chat_request.prompt}",
+            )
+            - 2 * MESSAGE_OVERHEAD_TOKENS,
+        )
+        history = await load_chat_history(db, chat_request.chat_id, budget)
+    generation_id = uuid.uuid4().hex
+    headers = {"X-Generation-Id": generation_id}
+    try:
+        if (
+            response_cache_enabled
+            and chat_request.chat_id is None
+            and chat_request.temperature <= response_cache_max_temperature
+        ):
+            # the lookup may embed the prompt, which is model work
+            response, headers["X-Response-Cache"] = await run_in_threadpool(
+                chat_model.generate_cached,
+                chat_request.prompt,
+                chat_request.system_prompt,
+                current_user.id,
+                generation_id,
+                max_new_tokens=chat_request.max_new_tokens,
+                temperature=chat_request.temperature,
+                top_p=chat_request.top_p,
+            )
+        else:
+            # tokenizing the prompt is model work too
+            response = await run_in_threadpool(
+                chat_model.generate_text,
+                chat_request.prompt,
+                chat_request.system_prompt,
+                current_user.id,
+                generation_id,
+                history=history,
+                chat_id=chat_request.chat_id,
+                max_new_tokens=chat_request.max_new_tokens,
+                temperature=chat_request.temperature,
+                top_p=chat_request.top_p,
+            )
+    except QueueFullError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Generation queue is full. Try again later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+        )
+    if "text/event-stream" not in request.headers.get("accept", ""):
+
+        async def text_stream():
+            try:
+                async for text in iterate_in_threadpool(response):
+                    yield text
+            finally:
+                # a no-op once the generation has finished
+                if chat_model.cancel(generation_id):
+                    print(f"Client went away, cancelled generation {generation_id}")
+
+        return StreamingResponse(
+            text_stream(),
+            media_type="text/plain",
+            headers=headers,
+        )
+
+    await sse.publisher.start(
+        generation_id,
+        current_user.id,
+        response,
+        chat_model.generations[generation_id][1],
+    )
+    return StreamingResponse(
+        sse.replay_events(sse.replay_store, generation_id, 0),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, **headers},
+    )
+
+
+@app.get("/api/v1/generate/{generation_id}/events", tags=["chat"])
+async def resume_generation(
+    generation_id: str,
+    current_user: Annotated[schemas.User, Depends(auths.get_current_user)],
+    last_event_id: Annotated[str | None, Header()] = None,
+):
+    """Replays the events after ``Last-Event-ID``, then follows the stream."""
+    if await sse.replay_store.owner(generation_id) != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Generation not found"
+        )
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Last-Event-ID"
+        )
     return StreamingResponse(
-        chat_model.generate_text(prompt, system_prompt, current_user.id, db),
-        media_type="text/plain",
+        sse.replay_events(sse.replay_store, generation_id, after),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 
+@app.post("/api/v1/generate/{generation_id}/cancel", tags=["chat"])
+async def cancel_generation(
+    generation_id: str,
+    current_user: Annotated[schemas.User, Depends(auths.get_current_user)],
+):
+    if chat_model is None or not chat_model.cancel(generation_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No running generation with this id",
+        )
+    return {"generation_id": generation_id, "cancelled": True}
+
+
+@app.get("/health/live", tags=["health"])
+async def liveness():
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["health"])
+async def readiness():
+    if model_status["state"] != "ready":
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=model_status
+        )
+    if chat_model.draft_checkpoint is not None:
+        return {**model_status, "speculative_decoding": chat_model.speculation_stats()}
+    return model_status
+
+
 @app.get(
     "/api/v1/test_rate/",
     dependencies=[Depends(RateLimiter(times=15, minutes=10))],
@@ -0,0 +1,31 @@
+"""composite indexes for keyset pagination of chats and messages
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 00:00:01
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_chats_user_id_created_at", "chats", ["user_id", "created_at", "id"]
+    )
+    op.create_index(
+        "ix_messages_chat_id_created_at", "messages", ["chat_id", "created_at", "id"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_messages_chat_id_created_at", table_name="messages")
+    op.drop_index("ix_chats_user_id_created_at", table_name="chats")
@@ -0,0 +1,71 @@
+"""soft archive for chats, cascade chat deletes to messages
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:02
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def messages_table(ondelete):
+    # SQLite cannot alter a foreign key, so batch mode rebuilds the table
+    # from this definition.
+    return sa.Table(
+        "messages",
+        sa.MetaData(),
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "chat_id", sa.Integer(), sa.ForeignKey("chats.id", ondelete=ondelete)
+        ),
+        sa.Column("sender", sa.String()),
+        sa.Column("content", sa.Text()),
+        sa.Column("created_at", sa.DateTime(timezone=True)),
+        sa.Index("ix_messages_id", "id"),
+        sa.Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id"),
+    )
+
+
+def replace_message_fk(ondelete):
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table(
+            "messages", recreate="always", copy_from=messages_table(ondelete)
+        ):
+            pass
+        return
+    op.drop_constraint("messages_chat_id_fkey", "messages", type_="foreignkey")
+    op.create_foreign_key(
+        "messages_chat_id_fkey",
+        "messages",
+        "chats",
+        ["chat_id"],
+        ["id"],
+        ondelete=ondelete,
+    )
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chats", sa.Column("archived_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.execute(
+        "DELETE FROM messages WHERE chat_id IS NULL "
+        "OR chat_id NOT IN (SELECT id FROM chats)"
+    )
+    replace_message_fk("CASCADE")
+
+
+def downgrade() -> None:
+    replace_message_fk(None)
+    with op.batch_alter_table("chats") as batch_op:
+        batch_op.drop_column("archived_at")
@@ -0,0 +1,288 @@
+from datetime import datetime
+
+import pytz
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from repositories.models import User, Item, Chat, Message
+from repositories import schemas, pagination
+
+from repositories import auths, principal_cache
+
+CHAT_TITLE_LENGTH = 80
+
+
+async def get_user(db: AsyncSession, username: str):
+    result = await db.execute(
+        select(User).options(selectinload(User.items)).where(User.username == username)
+    )
+    return result.scalars().first()
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(
+        select(User).options(selectinload(User.items)).where(User.email == email)
+    )
+    return result.scalars().first()
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await auths.hash_password(user.password)
+    db_user = User(
+        username=user.username,
+        email=user.email,
+        full_name=user.full_name,
+        hashed_password=hashed_password,
+        disabled=user.disabled,
+        is_admin=user.is_admin,
+        items=[],
+    )
+    db.add(db_user)
+    await db.commit()
+    return db_user
+
+
+async def create_item(db: AsyncSession, item: schemas.ItemCreate, user_id: int):
+    db_item = Item(**item.dict(), owner_id=user_id)
+    db.add(db_item)
+    await db.commit()
+    return db_item
+
+
+async def get_items(db: AsyncSession, user_id: int):
+    result = await db.execute(select(Item).where(Item.owner_id == user_id))
+    return result.scalars().all()
+
+
+async def get_users(db: AsyncSession):
+    result = await db.execute(select(User).options(selectinload(User.items)))
+    return result.scalars().all()
+
+
+async def update_user(
+    db: AsyncSession, user: schemas.User, user_update: schemas.UserUpdate
+):
+    user = await db.get(User, user.id, options=[selectinload(User.items)])
+    if user_update.full_name is not None:
+        user.full_name = user_update.full_name
+    if user_update.phone_number is not None:
+        user.phone_number = user_update.phone_number
+    await db.commit()
+    # both the PUT and PATCH routes land here
+    await principal_cache.invalidate_user(user.username)
+    return user
+
+
+async def get_item(db: AsyncSession, item_id: int, user_id: int):
+    result = await db.execute(
+        select(Item).where(Item.id == item_id, Item.owner_id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def get_chat(db: AsyncSession, chat_id: int):
+    result = await db.execute(
+        select(Chat).options(selectinload(Chat.messages)).where(Chat.id == chat_id)
+    )
+    return result.scalars().first()
+
+
+async def get_chats(db: AsyncSession, user_id: int):
+    result = await db.execute(
+        select(Chat).options(selectinload(Chat.messages)).where(Chat.user_id == user_id)
+    )
+    return result.scalars().all()
+
+
+async def get_chats_paginated(
+    db: AsyncSession,
+    user_id: int,
+    page: int = 1,
+    page_size: int = 5,
+    cursor: str | None = None,
+    count: str = "exact",
+):
+    """Newest chats first, with all messages loaded in one extra query.
+
+    With ``cursor`` the page starts after that chat (keyset on
+    ``(created_at, id)``); otherwise ``page`` is used as an offset.
+    """
+    query = (
+        select(Chat)
+        .options(selectinload(Chat.messages))
+        .where(Chat.user_id == user_id, Chat.archived_at.is_(None))
+        .order_by(Chat.created_at.desc(), Chat.id.desc())
+    )
+    query = pagination.paginate(
+        query, (Chat.created_at, Chat.id), page, page_size, cursor, desc=True
+    )
+    result = await db.execute(query)
+    chats, next_cursor = pagination.split_page(result.scalars().all(), page_size)
+    total, capped = await pagination.count_rows(
+        db,
+        select(Chat.id).where(Chat.user_id == user_id, Chat.archived_at.is_(None)),
+        count,
+    )
+    return chats, total, capped, next_cursor
+
+
+async def get_chat_summaries_paginated(
+    db: AsyncSession,
+    user_id: int,
+    page: int = 1,
+    page_size: int = 5,
+    cursor: str | None = None,
+    count: str = "exact",
+):
+    """Same pages as ``get_chats_paginated`` without message bodies.
+
+    Each chat is titled with the start of its first user message; title and
+    message count come from correlated subqueries in a single statement.
+    """
+    title = (
+        select(func.substr(Message.content, 1, CHAT_TITLE_LENGTH))
+        .where(Message.chat_id == Chat.id, Message.sender == "user")
+        .order_by(Message.created_at, Message.id)
+        .limit(1)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.chat_id == Chat.id)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Chat.id,
+            Chat.user_id,
+            Chat.created_at,
+            title.label("title"),
+            message_count.label("message_count"),
+        )
+        .where(Chat.user_id == user_id, Chat.archived_at.is_(None))
+        .order_by(Chat.created_at.desc(), Chat.id.desc())
+    )
+    query = pagination.paginate(
+        query, (Chat.created_at, Chat.id), page, page_size, cursor, desc=True
+    )
+    result = await db.execute(query)
+    chats, next_cursor = pagination.split_page(result.all(), page_size)
+    total, capped = await pagination.count_rows(
+        db,
+        select(Chat.id).where(Chat.user_id == user_id, Chat.archived_at.is_(None)),
+        count,
+    )
+    return chats, total, capped, next_cursor
+
+
+async def get_chat_messages_paginated(
+    db: AsyncSession,
+    chat_id: int,
+    page: int = 1,
+    page_size: int = 5,
+    cursor: str | None = None,
+    count: str = "exact",
+):
+    """Oldest messages first, paged the same way as ``get_chats_paginated``."""
+    query = (
+        select(Message)
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+    )
+    query = pagination.paginate(
+        query, (Message.created_at, Message.id), page, page_size, cursor
+    )
+    result = await db.execute(query)
+    messages, next_cursor = pagination.split_page(result.scalars().all(), page_size)
+    total, capped = await pagination.count_rows(
+        db, select(Message.id).where(Message.chat_id == chat_id), count
+    )
+    return messages, total, capped, next_cursor
+
+
+async def create_chat(db: AsyncSession, user_id: int):
+    chat = Chat(user_id=user_id, messages=[])
+    db.add(chat)
+    await db.commit()
+    return chat
+
+
+async def get_chat_owner(db: AsyncSession, chat_id: int):
+    result = await db.execute(select(Chat.user_id).where(Chat.id == chat_id))
+    return result.scalar_one_or_none()
+
+
+async def get_recent_messages(db: AsyncSession, chat_id: int, limit: int):
+    """The newest ``limit`` messages of a chat, newest first."""
+    result = await db.execute(
+        select(Message.id, Message.sender, Message.content, Message.token_count)
+        .where(Message.chat_id == chat_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )
+    return result.all()
+
+
+async def set_message_token_counts(db: AsyncSession, counts: dict[int, int]):
+    await db.execute(
+        update(Message),
+        [
+            {"id": message_id, "token_count": token_count}
+            for message_id, token_count in counts.items()
+        ],
+    )
+    await db.commit()
+
+
+async def delete_chat(db: AsyncSession, chat_id: int, user_id: int):
+    """Delete one chat; its messages go with it through ON DELETE CASCADE."""
+    result = await db.execute(
+        delete(Chat).where(Chat.id == chat_id, Chat.user_id == user_id)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def archive_chats(db: AsyncSession, user_id: int):
+    """Soft-archive every live chat of a user in a single UPDATE."""
+    result = await db.execute(
+        update(Chat)
+        .where(Chat.user_id == user_id, Chat.archived_at.is_(None))
+        .values(archived_at=datetime.now(pytz.timezone("Asia/Tokyo")))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_chats(
+    session_factory, user_id: int, archived_only: bool = True, chunk_size: int = 500
+):
+    """Hard-delete a user's chats ``chunk_size`` at a time.
+
+    Each chunk commits on its own so locks on chats and messages are held
+    only briefly; messages are removed by the database cascade.
+    """
+    conditions = [Chat.user_id == user_id]
+    if archived_only:
+        conditions.append(Chat.archived_at.is_not(None))
+    deleted = 0
+    async with session_factory() as db:
+        while True:
+            ids = (
+                await db.scalars(select(Chat.id).where(*conditions).limit(chunk_size))
+            ).all()
+            if not ids:
+                break
+            await db.execute(
+                delete(Chat)
+                .where(Chat.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            deleted += len(ids)
+    print(f"Purged {deleted} chats for user {user_id}")
+    return deleted
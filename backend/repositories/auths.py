@@ -1,10 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
-from repositories import crud
+from repositories import async_crud, principal_cache
 import jwt
 from repositories import schemas
-from repositories.database import get_db
+from repositories.database import get_async_db
 from dotenv import find_dotenv, load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -12,7 +14,7 @@ from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
 from jose import JWTError, jwt
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 load_dotenv(find_dotenv())
 
@@ -27,7 +29,22 @@ FRONTEND_URL = os.getenv(
     "FRONTEND_URL", "http://localhost:5173"
 )  # Default to localhost if not set
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+
+# min == max == default so hashes made with any other cost are rehashed on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+pending_password_hashes = 0
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Configure email settings
@@ -52,12 +69,44 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = crud.get_user(db, username)
+async def run_password_hash(fn, *args):
+    global pending_password_hashes
+    if pending_password_hashes >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress. Try again later.",
+            headers={"Retry-After": "1"},
+        )
+    pending_password_hashes += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_hash_executor, fn, *args)
+    finally:
+        pending_password_hashes -= 1
+
+
+async def verify_and_update_password(plain_password, hashed_password):
+    return await run_password_hash(
+        pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+
+async def hash_password(password):
+    return await run_password_hash(pwd_context.hash, password)
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await async_crud.get_user(db, username)
     if not user:
         return None, "User not found. Check your username or sign up."
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await verify_and_update_password(
+        password, user.hashed_password
+    )
+    if not verified:
         return None, "Incorrect password. Check your password or reset it."
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     if user.disabled:
         return (
             None,
@@ -136,24 +185,34 @@ async def send_password_reset_email(
 
 
 async def get_current_user(
-    token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)
+    token: Annotated[str, Depends(oauth2_scheme)],
+    db: AsyncSession = Depends(get_async_db),
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    username = await principal_cache.get_username(token)
+    if username is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = schemas.TokenData(username=username)
+        except (InvalidTokenError, JWTError):
             raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except InvalidTokenError:
-        raise credentials_exception
-    user = crud.get_user(db, username=token_data.username)
+        await principal_cache.set_username(
+            token, token_data.username, payload.get("exp")
+        )
+    user = await principal_cache.get_user(username)
     if user is None:
-        raise credentials_exception
+        db_user = await async_crud.get_user(db, username=username)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.User.model_validate(db_user, from_attributes=True)
+        await principal_cache.set_user(user)
     return user
 
 
@@ -166,7 +225,7 @@ async def get_current_active_user(
 
 
 def get_current_admin_user(
-    current_user: Annotated[schemas.User, Depends(get_current_user)]
+    current_user: Annotated[schemas.User, Depends(get_current_user)],
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
@@ -0,0 +1,239 @@
+import os
+import time
+from types import SimpleNamespace
+
+import torch
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BatchEncoding,
+    BitsAndBytesConfig,
+    GenerationConfig,
+)
+
+
+class InferenceBackend:
+    """Loads a model/tokenizer pair for a device; ChatModel only sees this."""
+
+    name = "base"
+    device = "cpu"
+
+    def load(self, model_checkpoint: str):
+        raise NotImplementedError
+
+    def load_draft(self, model_checkpoint: str):
+        """Loads a small model to propose tokens for speculative decoding."""
+        return self.load(model_checkpoint)
+
+
+class CudaBackend(InferenceBackend):
+    name = "cuda"
+    device = "cuda"
+
+    def __init__(self, torch_dtype=torch.bfloat16):
+        self.torch_dtype = torch_dtype
+
+    def load(self, model_checkpoint: str):
+        tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_checkpoint, torch_dtype=self.torch_dtype, device_map=self.device
+        )
+        return model, tokenizer
+
+
+class Cuda4BitBackend(InferenceBackend):
+    name = "cuda-4bit"
+    device = "cuda"
+
+    def load(self, model_checkpoint: str):
+        quantization_config = BitsAndBytesConfig(
+            load_in_4bit=True,  # use 4-bit quantization
+            bnb_4bit_compute_dtype=torch.float16,
+            bnb_4bit_use_double_quant=True,
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            model_checkpoint,
+            quantization_config=quantization_config,
+            device_map=self.device,
+        )
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_checkpoint, use_fast=True, padding_side="left"
+        )
+        return model, tokenizer
+
+
+class CpuBackend(InferenceBackend):
+    name = "cpu"
+    device = "cpu"
+
+    def __init__(
+        self,
+        num_threads: int | None = None,
+        num_interop_threads: int | None = None,
+        quantize: bool = True,
+    ):
+        self.num_threads = num_threads
+        self.num_interop_threads = num_interop_threads
+        self.quantize = quantize
+
+    def load(self, model_checkpoint: str):
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        if self.num_interop_threads:
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError as e:
+                print(f"Could not set inter-op threads: {e}")
+
+        tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
+        model = AutoModelForCausalLM.from_pretrained(
+            model_checkpoint, torch_dtype=torch.float32
+        )
+        model.eval()
+        if self.quantize:
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return model, tokenizer
+
+
+class StubTokenizer:
+    """ASCII character tokenizer; id 0 is the end-of-sequence token."""
+
+    eos_token_id = 0
+    pad_token_id = 0
+    vocab_size = 128
+
+    def encode(self, text: str, add_special_tokens: bool = False):
+        return [ord(c) if 0 < ord(c) < self.vocab_size else ord("?") for c in text]
+
+    def decode(self, token_ids, skip_special_tokens: bool = False):
+        if isinstance(token_ids, torch.Tensor):
+            token_ids = token_ids.tolist()
+        return "".join(chr(i) for i in token_ids if i != self.eos_token_id)
+
+    def apply_chat_template(
+        self,
+        messages,
+        tokenize: bool = True,
+        add_generation_prompt: bool = False,
+        **kwargs,
+    ):
+        text = "".join(f"<{m['role']}>{m['content']}\n" for m in messages)
+        if add_generation_prompt:
+            text += "<assistant>"
+        return self.encode(text) if tokenize else text
+
+    def __call__(self, text: str, return_tensors=None, **kwargs):
+        input_ids = [self.encode(text)]
+        if return_tensors == "pt":
+            input_ids = torch.tensor(input_ids)
+            return BatchEncoding(
+                {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+            )
+        return BatchEncoding({"input_ids": input_ids})
+
+
+class StubModel(torch.nn.Module):
+    """Deterministic stand-in for a causal LM.
+
+    The next token is a fixed function of the previous token and its position,
+    and the KV cache carries the token ids, so batching, prefix reuse and
+    padding behave exactly as with a real model. ``token_latency`` adds a
+    sleep per forward pass to emulate model cost in load tests. A draft
+    stub with ``disagree_every`` set picks a different token at every
+    position divisible by it.
+    """
+
+    _supports_cache_class = False
+
+    def __init__(
+        self,
+        vocab_size: int = 128,
+        token_latency: float = 0.0,
+        disagree_every: int = 0,
+    ):
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.token_latency = token_latency
+        self.disagree_every = disagree_every
+        self.generation_config = GenerationConfig(eos_token_id=0)
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    def next_tokens(self, input_ids, position_ids):
+        tokens = 32 + (input_ids * 31 + position_ids * 17) % 95
+        if self.disagree_every:
+            miss = position_ids % self.disagree_every == 0
+            tokens = torch.where(miss, 32 + (tokens - 31) % 95, tokens)
+        return tokens
+
+    def forward(
+        self,
+        input_ids,
+        attention_mask=None,
+        position_ids=None,
+        past_key_values=None,
+        use_cache=True,
+        **kwargs,
+    ):
+        if self.token_latency:
+            time.sleep(self.token_latency)
+        past_len = 0 if past_key_values is None else past_key_values[0][0].shape[-2]
+        if position_ids is None:
+            position_ids = torch.arange(
+                past_len, past_len + input_ids.shape[-1]
+            ).expand_as(input_ids)
+        logits = torch.nn.functional.one_hot(
+            self.next_tokens(input_ids, position_ids), self.vocab_size
+        ).float()
+        kv = input_ids[:, None, :, None].float()
+        if past_key_values is not None:
+            kv = torch.cat([past_key_values[0][0], kv], dim=-2)
+        return SimpleNamespace(logits=logits, past_key_values=((kv, kv),))
+
+    def generate(self, input_ids, max_new_tokens: int = 16, **kwargs):
+        output = input_ids
+        for _ in range(max_new_tokens):
+            position_ids = torch.full_like(output[:, -1:], output.shape[-1] - 1)
+            next_token = self.next_tokens(output[:, -1:], position_ids)
+            output = torch.cat([output, next_token], dim=-1)
+        return output
+
+
+class StubBackend(InferenceBackend):
+    name = "stub"
+    device = "cpu"
+
+    def __init__(self, token_latency: float = 0.0, draft_disagree_every: int = 4):
+        self.token_latency = token_latency
+        self.draft_disagree_every = draft_disagree_every
+
+    def load(self, model_checkpoint: str):
+        return StubModel(token_latency=self.token_latency), StubTokenizer()
+
+    def load_draft(self, model_checkpoint: str):
+        model = StubModel(disagree_every=self.draft_disagree_every)
+        return model, StubTokenizer()
+
+
+def get_backend(name: str | None = None) -> InferenceBackend:
+    name = name or os.getenv("INFERENCE_BACKEND", "cuda")
+    if name == "cuda":
+        return CudaBackend()
+    if name == "cuda-4bit":
+        return Cuda4BitBackend()
+    if name == "cpu":
+        return CpuBackend(
+            num_threads=int(os.getenv("CPU_NUM_THREADS", 0)) or None,
+            num_interop_threads=int(os.getenv("CPU_NUM_INTEROP_THREADS", 0)) or None,
+            quantize=os.getenv("CPU_QUANTIZE", "true").lower() == "true",
+        )
+    if name == "stub":
+        return StubBackend(
+            token_latency=float(os.getenv("STUB_TOKEN_LATENCY_SECONDS", 0)),
+            draft_disagree_every=int(os.getenv("STUB_DRAFT_DISAGREE_EVERY", 4)),
+        )
+    raise ValueError(f"Unknown inference backend: {name}")
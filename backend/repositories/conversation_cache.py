@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+
+from repositories.prefix_cache import cache_nbytes, common_prefix_length
+
+
+def _move_cache(past_key_values, device, non_blocking: bool = False):
+    return tuple(
+        tuple(tensor.to(device, non_blocking=non_blocking) for tensor in layer)
+        for layer in past_key_values
+    )
+
+
+class _Entry:
+    def __init__(self, token_ids: tuple, past_key_values, nbytes: int, device):
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = nbytes
+        self.device = device
+        self.spilled = False
+        self.used_at = time.monotonic()
+
+
+class ConversationCache:
+    """Keeps the past_key_values of each chat's last turn between turns.
+
+    An entry holds the KV cache for the tokens of the previous prompt and
+    reply; the next turn's prompt starts with them, so only the new message
+    needs a prefill. Entries unused for ``idle_seconds`` are dropped. Past
+    ``max_bytes`` on the model's device the least recently used entries
+    move to host memory while ``host_max_bytes`` allows, and are dropped
+    after that.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        idle_seconds: float = 600.0,
+        host_max_bytes: int = 0,
+        min_tokens: int = 32,
+        host_device="cpu",
+    ):
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.host_max_bytes = host_max_bytes
+        self.min_tokens = min_tokens
+        self.host_device = host_device
+        self.nbytes = 0
+        self.host_nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def take(self, key, input_ids: list[int], device):
+        """Removes ``key``'s entry and returns the part that prefixes the prompt.
+
+        Returns ``(length, past_key_values)``, with ``(0, None)`` on a miss.
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._release(entry)
+        length = 0
+        if entry is not None:
+            length = common_prefix_length(entry.token_ids, input_ids)
+        if length < self.min_tokens:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        past_key_values = entry.past_key_values
+        if entry.spilled:
+            past_key_values = _move_cache(past_key_values, device, non_blocking=True)
+        if length < len(entry.token_ids):
+            past_key_values = tuple(
+                tuple(tensor[..., :length, :] for tensor in layer)
+                for layer in past_key_values
+            )
+        return length, past_key_values
+
+    def put(self, key, token_ids: list[int], past_key_values, device):
+        if len(token_ids) < self.min_tokens:
+            return
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            return
+        entry = _Entry(tuple(token_ids), past_key_values, nbytes, device)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._release(old)
+            self._entries[key] = entry
+            self.nbytes += nbytes
+            self._expire()
+            self._make_room()
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._release(entry)
+
+    def _release(self, entry: _Entry):
+        if entry.spilled:
+            self.host_nbytes -= entry.nbytes
+        else:
+            self.nbytes -= entry.nbytes
+
+    def _expire(self):
+        deadline = time.monotonic() - self.idle_seconds
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.used_at > deadline:
+                break
+            del self._entries[key]
+            self._release(entry)
+
+    def _make_room(self):
+        for key, entry in list(self._entries.items()):
+            if self.nbytes <= self.max_bytes:
+                break
+            if entry.spilled:
+                continue
+            self.nbytes -= entry.nbytes
+            on_host = (
+                torch.device(entry.device).type == torch.device(self.host_device).type
+            )
+            if not on_host and entry.nbytes <= self.host_max_bytes:
+                entry.past_key_values = _move_cache(
+                    entry.past_key_values, self.host_device
+                )
+                entry.spilled = True
+                self.host_nbytes += entry.nbytes
+            else:
+                del self._entries[key]
+        for key, entry in list(self._entries.items()):
+            if self.host_nbytes <= self.host_max_bytes:
+                break
+            if entry.spilled:
+                del self._entries[key]
+                self.host_nbytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.host_nbytes = 0
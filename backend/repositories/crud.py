@@ -1,4 +1,6 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+
+from sqlalchemy.orm import Session, selectinload
 from repositories.models import User, Item, Chat, Message
 from repositories import schemas
 
@@ -75,6 +77,51 @@ def create_message(db: Session, chat_id: int, sender: str, content: str):
     return db_message
 
 
+def create_chats_with_messages(db: Session, records: list[dict]):
+    """Stores each turn in a new chat, or appends it to ``chat_id`` if set.
+
+    Turns for chats deleted in the meantime are dropped.
+    """
+    continued = {record["chat_id"] for record in records if record.get("chat_id")}
+    existing = set()
+    if continued:
+        existing = {
+            chat_id for (chat_id,) in db.query(Chat.id).filter(Chat.id.in_(continued))
+        }
+    chats = []
+    for record in records:
+        started_at = datetime.fromisoformat(record["started_at"])
+        finished_at = datetime.fromisoformat(record["finished_at"])
+        messages = [
+            Message(
+                sender="user",
+                content=record["prompt"],
+                token_count=record.get("prompt_tokens"),
+                created_at=started_at,
+            ),
+            Message(
+                sender="bot",
+                content=record["response"],
+                token_count=record.get("response_tokens"),
+                created_at=finished_at,
+            ),
+        ]
+        chat_id = record.get("chat_id")
+        if chat_id is None:
+            chat = Chat(user_id=record["user_id"], created_at=started_at)
+            chat.messages = messages
+            chats.append(chat)
+        elif chat_id in existing:
+            for message in messages:
+                message.chat_id = chat_id
+            db.add_all(messages)
+        else:
+            print(f"Dropping a turn for deleted chat {chat_id}")
+    db.add_all(chats)
+    db.commit()
+    return chats
+
+
 def get_chats(db: Session, user_id: int):
     return db.query(Chat).filter(Chat.user_id == user_id).all()
 
@@ -83,8 +130,9 @@ def get_chats_paginated(db: Session, user_id: int, page: int = 1, page_size: int
     offset = (page - 1) * page_size
     chats = (
         db.query(Chat)
+        .options(selectinload(Chat.messages))
         .filter(Chat.user_id == user_id)
-        .order_by(Chat.created_at.desc())
+        .order_by(Chat.created_at.desc(), Chat.id.desc())
         .offset(offset)
         .limit(page_size)
         .all()
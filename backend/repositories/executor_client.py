@@ -0,0 +1,211 @@
+import random
+import time
+from contextlib import asynccontextmanager
+from math import ceil
+
+import httpx
+
+DEFAULT_EXECUTOR_URL = "http://code_execution_service:8001"
+
+
+class ExecutorUnavailableError(Exception):
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open no requests are sent. Once ``reset_timeout`` has passed a
+    single trial request is let through per interval; a success closes the
+    breaker and a failure keeps it open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def available(self) -> bool:
+        return self.opened_at is None or self.retry_after() <= 0
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return self.opened_at + self.reset_timeout - time.monotonic()
+
+    def acquire(self):
+        if self.opened_at is not None:
+            # the trial request holds the breaker open for another interval
+            self.opened_at = time.monotonic()
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print("Code executor recovered, closing circuit breaker")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failure_threshold and self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"Circuit breaker opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+class ExecutorEndpoint:
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url.rstrip("/")
+        self.breaker = breaker
+        self.outstanding = 0
+
+
+class ExecutorClient:
+    """Shared keep-alive client spread over one or more executor instances.
+
+    Each request goes to the available endpoint with the fewest requests in
+    flight. Connection failures and 503s count against an endpoint's
+    breaker; since neither means the code ran, the request is retried once
+    on every other available endpoint before giving up.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        timeout: httpx.Timeout,
+        limits: httpx.Limits,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        transport=None,
+    ):
+        if not urls:
+            raise ValueError("At least one code executor URL is required")
+        self.endpoints = [
+            ExecutorEndpoint(url, CircuitBreaker(failure_threshold, reset_timeout))
+            for url in urls
+        ]
+        self.client = httpx.AsyncClient(
+            timeout=timeout, limits=limits, transport=transport
+        )
+
+    def _pick(self, tried: set) -> ExecutorEndpoint:
+        candidates = [
+            endpoint
+            for endpoint in self.endpoints
+            if endpoint not in tried and endpoint.breaker.available()
+        ]
+        if not candidates:
+            retry_after = min(
+                endpoint.breaker.retry_after() for endpoint in self.endpoints
+            )
+            raise ExecutorUnavailableError(
+                "Code execution service is unavailable. Try again later.",
+                retry_after=max(1, ceil(retry_after)),
+            )
+        fewest = min(endpoint.outstanding for endpoint in candidates)
+        endpoint = random.choice(
+            [endpoint for endpoint in candidates if endpoint.outstanding == fewest]
+        )
+        endpoint.breaker.acquire()
+        return endpoint
+
+    def _has_fallback(self, tried: set) -> bool:
+        return any(
+            endpoint not in tried and endpoint.breaker.available()
+            for endpoint in self.endpoints
+        )
+
+    async def _send(self, path: str, json: dict, stream: bool):
+        """Returns the response and the endpoint whose count it still holds."""
+        tried = set()
+        while True:
+            endpoint = self._pick(tried)
+            tried.add(endpoint)
+            endpoint.outstanding += 1
+            try:
+                response = await self.client.send(
+                    self.client.build_request("POST", endpoint.url + path, json=json),
+                    stream=stream,
+                )
+            except httpx.RequestError as e:
+                endpoint.outstanding -= 1
+                # running out of local connections says nothing about the executor
+                if not isinstance(e, httpx.PoolTimeout):
+                    endpoint.breaker.record_failure()
+                retryable = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if retryable and self._has_fallback(tried):
+                    print(f"Code executor {endpoint.url} unreachable: {e!r}")
+                    continue
+                raise
+            except BaseException:
+                endpoint.outstanding -= 1
+                raise
+
+            if response.status_code != 503:
+                endpoint.breaker.record_success()
+                return response, endpoint
+            endpoint.breaker.record_failure()
+            if not self._has_fallback(tried):
+                return response, endpoint
+            await response.aclose()
+            endpoint.outstanding -= 1
+
+    async def post(self, path: str, json: dict) -> httpx.Response:
+        response, endpoint = await self._send(path, json, stream=False)
+        endpoint.outstanding -= 1
+        return response
+
+    @asynccontextmanager
+    async def stream(self, path: str, json: dict):
+        response, endpoint = await self._send(path, json, stream=True)
+        try:
+            yield response
+        finally:
+            endpoint.outstanding -= 1
+            await response.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+executor_client: ExecutorClient | None = None
+
+
+def init(
+    urls: list[str],
+    connect_timeout: float = 5.0,
+    read_timeout: float = 60.0,
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 30.0,
+    failure_threshold: int = 5,
+    reset_timeout: float = 30.0,
+) -> ExecutorClient:
+    global executor_client
+    executor_client = ExecutorClient(
+        urls,
+        timeout=httpx.Timeout(connect_timeout, read=read_timeout),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        failure_threshold=failure_threshold,
+        reset_timeout=reset_timeout,
+    )
+    return executor_client
+
+
+async def close():
+    global executor_client
+    if executor_client is not None:
+        await executor_client.aclose()
+        executor_client = None
+
+
+def get_executor_client() -> ExecutorClient:
+    if executor_client is None:
+        raise RuntimeError("Code executor client is not initialised")
+    return executor_client
@@ -1,4 +1,13 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+)
 from sqlalchemy.orm import relationship
 
 from datetime import datetime
@@ -45,21 +54,38 @@ class Chat(Base):
         DateTime(timezone=True),
         default=lambda: datetime.now(pytz.timezone("Asia/Tokyo")),
     )
+    archived_at = Column(DateTime(timezone=True), nullable=True)
 
     user = relationship("User", back_populates="chats")
-    messages = relationship("Message", back_populates="chat")
+    messages = relationship(
+        "Message",
+        back_populates="chat",
+        order_by="(Message.created_at, Message.id)",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        Index("ix_chats_user_id_created_at", "user_id", "created_at", "id"),
+    )
 
 
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(Integer, ForeignKey("chats.id"))
+    chat_id = Column(Integer, ForeignKey("chats.id", ondelete="CASCADE"))
     sender = Column(String)
     content = Column(Text)
+    # tokens of ``content`` alone, counted when the message is stored
+    token_count = Column(Integer, nullable=True)
     created_at = Column(
         DateTime(timezone=True),
         default=lambda: datetime.now(pytz.timezone("Asia/Tokyo")),
     )
 
     chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id"),
+    )
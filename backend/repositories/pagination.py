@@ -0,0 +1,56 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import func, select, tuple_
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    payload = json.dumps({"created_at": created_at.isoformat(), "id": id})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(payload["created_at"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid pagination cursor") from e
+
+
+def paginate(query, key_columns, page: int, page_size: int, cursor=None, desc=False):
+    """Restrict ``query`` to one page, fetching one extra row to detect the next.
+
+    With ``cursor`` rows are taken after the cursor's ``(created_at, id)``
+    in ``key_columns`` order, otherwise ``page`` is used as an offset.
+    """
+    if cursor is not None:
+        key, value = tuple_(*key_columns), decode_cursor(cursor)
+        query = query.where(key < value if desc else key > value)
+    else:
+        query = query.offset((page - 1) * page_size)
+    return query.limit(page_size + 1)
+
+
+def split_page(rows, page_size: int):
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+async def count_rows(db, query, mode: str = "exact", cap: int = 1000):
+    """Row count for ``query`` as ``(total, capped)``.
+
+    ``mode`` is "exact", "capped" (counts at most ``cap`` rows; ``capped``
+    is True when there are more) or "none", which skips it.
+    """
+    if mode == "none":
+        return None, False
+    if mode == "capped":
+        query = query.limit(cap + 1)
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    if mode == "capped" and total > cap:
+        return cap, True
+    return total, False
@@ -0,0 +1,186 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from repositories import crud
+
+_STOP = object()
+# errors a record causes on its own, which retrying cannot fix
+_REJECTED = (IntegrityError, DataError, KeyError, ValueError)
+
+
+class ChatPersistenceQueue:
+    """Write-behind buffer for generated chats.
+
+    Records are inserted in bulk by a background thread once ``batch_size``
+    records are waiting or ``flush_interval`` seconds have passed. Records
+    that cannot be written (database down, queue full, shutdown) are appended
+    to ``spool_path`` and replayed on the next start. When a batch fails its
+    records are retried one by one, and records the database rejects on
+    their own (constraint or data errors) go to ``spool_path + ".dead"``
+    instead of failing the batch on every replay. Turns that continue a chat
+    stay visible through ``pending_turns`` until they are written, so the
+    next turn's context does not miss them.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000,
+        spool_path: str = "chat_spool.jsonl",
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._spool_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_turns = {}
+        self._thread = None
+
+    def start(self):
+        self._replay_spool()
+        self._thread = threading.Thread(
+            target=self._run, name="chat-persistence", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def enqueue(
+        self,
+        user_id: int,
+        prompt: str,
+        response: str,
+        started_at: datetime,
+        finished_at: datetime,
+        chat_id: int | None = None,
+        prompt_tokens: int | None = None,
+        response_tokens: int | None = None,
+    ):
+        record = {
+            "user_id": user_id,
+            "prompt": prompt,
+            "response": response,
+            "started_at": started_at.isoformat(),
+            "finished_at": finished_at.isoformat(),
+            "chat_id": chat_id,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        }
+        if chat_id is not None:
+            with self._pending_lock:
+                self._pending_turns.setdefault(chat_id, []).append(record)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._spool([record])
+
+    def pending_turns(self, chat_id: int) -> list[dict]:
+        with self._pending_lock:
+            return list(self._pending_turns.get(chat_id, ()))
+
+    def _forget(self, records: list[dict]):
+        with self._pending_lock:
+            for record in records:
+                turns = self._pending_turns.get(record.get("chat_id"))
+                if turns is None:
+                    continue
+                turns[:] = [turn for turn in turns if turn is not record]
+                if not turns:
+                    del self._pending_turns[record["chat_id"]]
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if stopping:
+                batch.extend(self._drain())
+            if batch:
+                self._flush(batch)
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _flush(self, records: list[dict]):
+        try:
+            self._write(records)
+        except Exception as e:
+            print(f"Failed to persist {len(records)} chats, retrying each: {e}")
+        else:
+            self._forget(records)
+            return
+        for i, record in enumerate(records):
+            try:
+                self._write([record])
+            except _REJECTED as e:
+                print(f"Dead-lettering a chat that cannot be stored: {e}")
+                self._spool([record], f"{self.spool_path}.dead")
+            except Exception as e:
+                # the rest stay pending, so the chat's next turns still see them
+                print(f"Failed to persist {len(records) - i} chats, spooling: {e}")
+                self._spool(records[i:])
+                return
+            self._forget([record])
+
+    def _write(self, records: list[dict]):
+        db = self.session_factory()
+        try:
+            crud.create_chats_with_messages(db, records)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _spool(self, records: list[dict], path: str | None = None):
+        with self._spool_lock:
+            with open(path or self.spool_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+
+    def _replay_spool(self):
+        with self._spool_lock:
+            if not os.path.exists(self.spool_path):
+                return
+            replay_path = f"{self.spool_path}.replay"
+            os.replace(self.spool_path, replay_path)
+        with open(replay_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        print(f"Replaying {len(records)} spooled chats")
+        for i in range(0, len(records), self.batch_size):
+            self._flush(records[i : i + self.batch_size])
+        os.remove(replay_path)
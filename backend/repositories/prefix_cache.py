@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+
+
+def cache_nbytes(past_key_values) -> int:
+    return sum(
+        tensor.numel() * tensor.element_size()
+        for layer in past_key_values
+        for tensor in layer
+    )
+
+
+def common_prefix_length(a: list[int], b: list[int]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class PrefixCache:
+    """LRU store of past_key_values keyed by the prompt tokens they encode.
+
+    Entries are looked up by the longest cached key that prefixes the prompt,
+    and evicted least-recently-used first once ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self, max_bytes: int, min_tokens: int = 32):
+        self.max_bytes = max_bytes
+        self.min_tokens = min_tokens
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lengths = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, input_ids: list[int]):
+        with self._lock:
+            for length in sorted(self._lengths, reverse=True):
+                if length > len(input_ids):
+                    continue
+                key = tuple(input_ids[:length])
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return length, entry[0]
+            self.misses += 1
+            return 0, None
+
+    def insert(self, input_ids: list[int], past_key_values):
+        if len(input_ids) < self.min_tokens:
+            return
+        key = tuple(input_ids)
+        nbytes = cache_nbytes(past_key_values)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (past_key_values, nbytes)
+            self._lengths[len(key)] = self._lengths.get(len(key), 0) + 1
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        key, (_, nbytes) = self._entries.popitem(last=False)
+        self.nbytes -= nbytes
+        self._lengths[len(key)] -= 1
+        if not self._lengths[len(key)]:
+            del self._lengths[len(key)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lengths.clear()
+            self.nbytes = 0
@@ -0,0 +1,136 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+import aioredis
+
+from repositories import schemas
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class RedisStore:
+    def __init__(self, redis, prefix: str = "principal"):
+        self.redis = redis
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        try:
+            return await self.redis.get(f"{self.prefix}:{key}")
+        except aioredis.RedisError as e:
+            print(f"Principal cache read failed: {e}")
+            return None
+
+    async def set(self, key: str, value: str, ttl: int):
+        try:
+            await self.redis.set(f"{self.prefix}:{key}", value, ex=ttl)
+        except aioredis.RedisError as e:
+            print(f"Principal cache write failed: {e}")
+
+    async def delete(self, key: str):
+        # the write this follows has committed; a stale entry lives out its ttl
+        try:
+            await self.redis.delete(f"{self.prefix}:{key}")
+        except aioredis.RedisError as e:
+            print(f"Principal cache invalidation failed: {e}")
+
+
+class PrincipalCache:
+    """Caches verified token subjects and the users they resolve to.
+
+    Tokens are stored by SHA-256 digest and never outlive their ``exp`` claim.
+    Users are cached as ``schemas.User`` (no password hash) and must be
+    invalidated whenever their row changes.
+    """
+
+    def __init__(self, store, ttl: int = 30):
+        self.store = store
+        self.ttl = ttl
+
+    @staticmethod
+    def _token_key(token: str):
+        return "token:" + hashlib.sha256(token.encode()).hexdigest()
+
+    async def get_username(self, token: str):
+        return await self.store.get(self._token_key(token))
+
+    async def set_username(self, token: str, username: str, expires_at=None):
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, int(expires_at - time.time()))
+        if ttl > 0:
+            await self.store.set(self._token_key(token), username, ttl)
+
+    async def get_user(self, username: str):
+        value = await self.store.get(f"user:{username}")
+        if value is None:
+            return None
+        return schemas.User.model_validate_json(value)
+
+    async def set_user(self, user: schemas.User):
+        if self.ttl > 0:
+            await self.store.set(
+                f"user:{user.username}", user.model_dump_json(), self.ttl
+            )
+
+    async def invalidate_user(self, username: str):
+        await self.store.delete(f"user:{username}")
+
+
+principal_cache = PrincipalCache(MemoryStore())
+
+
+def init(backend: str = "memory", redis=None, ttl: int = 30, max_entries: int = 10000):
+    global principal_cache
+    if backend == "redis":
+        store = RedisStore(redis)
+    elif backend == "memory":
+        store = MemoryStore(max_entries=max_entries)
+    else:
+        raise ValueError(f"Unknown principal cache backend: {backend}")
+    principal_cache = PrincipalCache(store, ttl=ttl)
+    return principal_cache
+
+
+async def get_username(token: str):
+    return await principal_cache.get_username(token)
+
+
+async def set_username(token: str, username: str, expires_at=None):
+    await principal_cache.set_username(token, username, expires_at)
+
+
+async def get_user(username: str):
+    return await principal_cache.get_user(username)
+
+
+async def set_user(user: schemas.User):
+    await principal_cache.set_user(user)
+
+
+async def invalidate_user(username: str):
+    await principal_cache.invalidate_user(username)
@@ -0,0 +1,157 @@
+import time
+from collections import OrderedDict
+from math import ceil
+
+import aioredis
+from fastapi import HTTPException, Request, status
+
+# KEYS[1] cooldown key, KEYS[2] counter key
+# ARGV[1] limit, ARGV[2] window in ms, ARGV[3] cooldown in ms
+# Returns the remaining block time in ms, 0 when the request is allowed.
+RATE_LIMIT_SCRIPT = """
+local cooldown = redis.call('PTTL', KEYS[1])
+if cooldown > 0 then
+    return cooldown
+end
+local current = redis.call('INCR', KEYS[2])
+if current == 1 then
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+end
+if current > tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[1], 1, 'PX', ARGV[3])
+    return tonumber(ARGV[3])
+end
+return 0
+"""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def take(self, key: str) -> float:
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            self._buckets[key] = (tokens - 1, now)
+            wait = 0.0
+        else:
+            self._buckets[key] = (tokens, now)
+            wait = (1 - tokens) / self.rate
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class RateLimitEngine:
+    """Cooldown check and counter update in one Redis round-trip.
+
+    Cooldowns seen from Redis are remembered in-process until they expire, for
+    at most ``max_cooldowns`` identifiers, and the optional local token bucket
+    rejects hot keys before they reach Redis.
+    """
+
+    def __init__(
+        self,
+        redis,
+        cooldown_seconds: int = 3 * 60,
+        prefix: str = "ratelimit",
+        local_bucket: TokenBucket | None = None,
+        max_cooldowns: int = 10000,
+    ):
+        self.redis = redis
+        self.cooldown_ms = cooldown_seconds * 1000
+        self.prefix = prefix
+        self.local_bucket = local_bucket
+        self._script = redis.register_script(RATE_LIMIT_SCRIPT)
+        self.max_cooldowns = max_cooldowns
+        # identifier -> expiry, oldest first; Redis still holds any dropped one
+        self._local_cooldowns = OrderedDict()
+
+    async def hit(self, identifier: str, limit: int, window_ms: int) -> int:
+        now = time.monotonic()
+        expires = self._local_cooldowns.get(identifier)
+        if expires is not None:
+            if expires > now:
+                return ceil((expires - now) * 1000)
+            del self._local_cooldowns[identifier]
+
+        if self.local_bucket is not None:
+            wait = self.local_bucket.take(identifier)
+            if wait > 0:
+                return ceil(wait * 1000)
+
+        try:
+            pexpire = await self._script(
+                keys=[
+                    f"cooldown:{identifier}",
+                    f"{self.prefix}:{identifier}:{limit}:{window_ms}",
+                ],
+                args=[limit, window_ms, self.cooldown_ms],
+            )
+        except aioredis.RedisError as e:
+            print(f"Rate limit check failed, allowing request: {e}")
+            return 0
+        pexpire = int(pexpire)
+        if pexpire > 0:
+            self._local_cooldowns[identifier] = now + pexpire / 1000
+            if len(self._local_cooldowns) > self.max_cooldowns:
+                self._local_cooldowns.popitem(last=False)
+        return pexpire
+
+
+rate_limit_engine: RateLimitEngine | None = None
+
+
+def init(
+    redis,
+    cooldown_seconds: int = 3 * 60,
+    local_rate: float = 0,
+    local_burst: float = 0,
+) -> RateLimitEngine:
+    global rate_limit_engine
+    local_bucket = None
+    if local_rate > 0:
+        local_bucket = TokenBucket(local_rate, max(local_burst, 1))
+    rate_limit_engine = RateLimitEngine(
+        redis, cooldown_seconds=cooldown_seconds, local_bucket=local_bucket
+    )
+    return rate_limit_engine
+
+
+def client_identifier(request: Request) -> str:
+    # X-Forwarded-For is client-controlled; uvicorn's --proxy-headers applies
+    # it to request.client only for peers in --forwarded-allow-ips
+    return f"{request.client.host}:{request.scope['path']}"
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        times: int = 1,
+        milliseconds: int = 0,
+        seconds: int = 0,
+        minutes: int = 0,
+        hours: int = 0,
+    ):
+        self.times = times
+        self.milliseconds = (
+            milliseconds + 1000 * seconds + 60000 * minutes + 3600000 * hours
+        )
+
+    async def __call__(self, request: Request):
+        if rate_limit_engine is None:
+            raise RuntimeError("Rate limiting is not initialised")
+        pexpire = await rate_limit_engine.hit(
+            client_identifier(request), self.times, self.milliseconds
+        )
+        if pexpire > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded. Try again later.",
+                headers={"Retry-After": str(ceil(pexpire / 1000))},
+            )
@@ -0,0 +1,317 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class TransformerEmbedder:
+    """Mean-pooled hidden states of a sentence embedding checkpoint."""
+
+    def __init__(self, model_checkpoint: str):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_checkpoint)
+        self.model = AutoModel.from_pretrained(model_checkpoint).eval()
+        self.dim = self.model.config.hidden_size
+
+    def __call__(self, text: str) -> torch.Tensor:
+        inputs = self.tokenizer(text, truncation=True, return_tensors="pt")
+        with torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state[0]
+        mask = inputs["attention_mask"][0, :, None].float()
+        vector = (hidden * mask).sum(dim=0) / mask.sum()
+        return vector / vector.norm()
+
+
+class CachedResponse:
+    """A finished response served from the cache, shaped like a stream."""
+
+    cancelled = False
+    draft_proposed = 0
+    draft_accepted = 0
+
+    def __init__(self, text: str, generated_ids: list[int]):
+        self.text = text
+        self.generated_ids = generated_ids
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __iter__(self):
+        if self.text and not self.cancelled:
+            yield self.text
+
+
+class ResponseCache:
+    """Finished responses by exact key, or by prompt embedding similarity.
+
+    Keys are ``(group, prompt)`` with both parts normalized. The group holds
+    everything that must match exactly, such as the system prompt. With an
+    ``embedder``, an exact miss compares the prompt's embedding with every
+    live entry of the same group in one matrix product. The nearest one is
+    used if its cosine similarity reaches ``similarity``. Without one only
+    exact matches count. Entries expire after ``ttl`` seconds, and the least
+    recently used go once ``max_entries`` are held.
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        similarity: float = 0.95,
+    ):
+        self.embedder = embedder
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._vectors = None
+        if embedder is not None:
+            self._vectors = torch.zeros((max_entries, embedder.dim))
+        self._groups = torch.zeros(max_entries, dtype=torch.long)
+        self._expires = torch.zeros(max_entries, dtype=torch.float64)
+        self._responses = [None] * max_entries
+        self._keys = [None] * max_entries
+        self._free = list(range(max_entries - 1, -1, -1))
+        # key -> slot, least recently used first
+        self._slots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._slots)
+
+    @staticmethod
+    def _group_id(group) -> int:
+        return hash(group)
+
+    def lookup(self, group, prompt: str):
+        """Returns the cached ``(text, generated_ids)`` or None."""
+        key = (group, normalize(prompt))
+        now = time.monotonic()
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is not None and self._expires[slot] > now:
+                self._slots.move_to_end(key)
+                self.exact_hits += 1
+                return self._responses[slot]
+        if self.embedder is None:
+            self.misses += 1
+            return None
+        vector = self.embedder(key[1])
+        with self._lock:
+            live = (self._groups == self._group_id(group)) & (self._expires > now)
+            if live.any():
+                scores = self._vectors @ vector
+                scores[~live] = -1.0
+                best = int(scores.argmax())
+                if scores[best] >= self.similarity:
+                    self._slots.move_to_end(self._keys[best])
+                    self.similar_hits += 1
+                    return self._responses[best]
+            self.misses += 1
+        return None
+
+    def store(self, group, prompt: str, text: str, generated_ids: list[int]):
+        key = (group, normalize(prompt))
+        vector = None if self.embedder is None else self.embedder(key[1])
+        with self._lock:
+            slot = self._slots.pop(key, None)
+            if slot is None:
+                slot = self._allocate()
+            self._slots[key] = slot
+            self._keys[slot] = key
+            self._responses[slot] = (text, generated_ids)
+            if vector is not None:
+                self._vectors[slot] = vector
+            self._groups[slot] = self._group_id(group)
+            self._expires[slot] = time.monotonic() + self.ttl
+
+    def _allocate(self) -> int:
+        if not self._free:
+            now = time.monotonic()
+            for key, slot in list(self._slots.items()):
+                if self._expires[slot] <= now:
+                    self._release(key)
+        if not self._free:
+            self._release(next(iter(self._slots)))
+        return self._free.pop()
+
+    def _release(self, key):
+        slot = self._slots.pop(key)
+        self._expires[slot] = 0.0
+        self._responses[slot] = None
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._slots):
+                self._release(key)
+
+
+class Subscription:
+    """One client's view of a shared generation; iterating yields its text."""
+
+    def __init__(self, flight: "Flight"):
+        self.flight = flight
+        self.cancelled = False
+
+    @property
+    def generated_ids(self):
+        return self.flight.stream.generated_ids
+
+    @property
+    def draft_proposed(self):
+        return self.flight.stream.draft_proposed
+
+    @property
+    def draft_accepted(self):
+        return self.flight.stream.draft_accepted
+
+    def cancel(self):
+        """Leaves the generation; it is cancelled once nobody is left."""
+        self.flight.leave(self)
+
+    def __iter__(self):
+        read = 0
+        while True:
+            with self.flight.changed:
+                self.flight.changed.wait_for(
+                    lambda: self.cancelled
+                    or self.flight.done
+                    or len(self.flight.parts) > read
+                )
+                if self.cancelled:
+                    return
+                parts = self.flight.parts[read:]
+                done = self.flight.done
+                error = self.flight.error
+            read += len(parts)
+            yield from parts
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class Flight:
+    """A generation drained by a thread of its own and shared by subscribers."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = threading.Condition()
+
+    def join(self) -> Subscription:
+        subscription = Subscription(self)
+        with self.changed:
+            self.subscribers += 1
+        return subscription
+
+    def leave(self, subscription: Subscription):
+        with self.changed:
+            if subscription.cancelled:
+                return
+            subscription.cancelled = True
+            self.subscribers -= 1
+            last = self.subscribers == 0 and not self.done
+            self.changed.notify_all()
+        if last:
+            self.stream.cancel()
+
+    def drain(self, on_done):
+        try:
+            for text in self.stream:
+                with self.changed:
+                    self.parts.append(text)
+                    self.changed.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            on_done(self)
+            with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+
+class SingleFlight:
+    """Runs one generation per key, however many requests ask for it.
+
+    A request for a key that is already generating joins that generation
+    and streams from its first token. When the generation finishes
+    uncancelled, ``on_finished(key, text, generated_ids)`` runs before it
+    leaves the registry. Later requests therefore find it in the cache.
+    """
+
+    def __init__(self, on_finished=None):
+        self.on_finished = on_finished
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._flights)
+
+    def join(self, key, start):
+        """Returns ``(subscription, shared)``; ``start()`` submits a new one."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and not flight.stream.cancelled:
+                return flight.join(), True
+            flight = Flight(start())
+            self._flights[key] = flight
+            subscription = flight.join()
+        threading.Thread(
+            target=flight.drain,
+            args=(lambda done: self._finish(key, done),),
+            name="single-flight",
+            daemon=True,
+        ).start()
+        return subscription, False
+
+    def _finish(self, key, flight: Flight):
+        if self.on_finished is not None and not (
+            flight.error or flight.stream.cancelled
+        ):
+            try:
+                self.on_finished(
+                    key, "".join(flight.parts), list(flight.stream.generated_ids)
+                )
+            except Exception as e:
+                print(f"Caching a finished generation failed: {e}")
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+
+response_cache: ResponseCache | None = None
+
+
+def init(
+    embedding_model: str | None = None,
+    max_entries: int = 10000,
+    ttl: float = 3600.0,
+    similarity: float = 0.95,
+):
+    global response_cache
+    # near-identical wording is no evidence of the same answer ("is 7919
+    # prime" vs "is 7917 prime"), so only a real embedding model may match
+    # prompts by similarity
+    embedder = TransformerEmbedder(embedding_model) if embedding_model else None
+    response_cache = ResponseCache(
+        embedder, max_entries=max_entries, ttl=ttl, similarity=similarity
+    )
+    return response_cache
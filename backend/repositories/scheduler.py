@@ -0,0 +1,595 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+_END = object()
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Generation queue is full")
+        self.retry_after = retry_after
+
+
+def _to_legacy_cache(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(tuple(layer) for layer in past_key_values)
+
+
+def _map_cache(past_key_values, fn):
+    return tuple(tuple(fn(tensor) for tensor in layer) for layer in past_key_values)
+
+
+def _left_pad_cache(past_key_values, pad: int):
+    if pad == 0:
+        return past_key_values
+    return _map_cache(past_key_values, lambda t: F.pad(t, (0, 0, pad, 0)))
+
+
+class GenerationStream:
+    """A single sequence in the batch; iterating it yields decoded text."""
+
+    def __init__(
+        self,
+        tokenizer,
+        input_ids: list[int],
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        do_sample: bool,
+        prefix_len: int = 0,
+        cache_key=None,
+    ):
+        self.tokenizer = tokenizer
+        self.input_ids = input_ids
+        self.prefix_len = prefix_len
+        self.cache_key = cache_key
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.do_sample = do_sample and temperature > 0
+        self.generated_ids: list[int] = []
+        self.next_token = None
+        self.position = len(input_ids)
+        self.finished = False
+        self.cancelled = False
+        self.draft_proposed = 0
+        self.draft_accepted = 0
+        self._queue = queue.Queue()
+
+    def push(self, token_id: int):
+        self.generated_ids.append(token_id)
+        self._queue.put(token_id)
+
+    def cancel(self):
+        """Asks the scheduler to drop this sequence before its next step."""
+        self.cancelled = True
+
+    def end(self, error: Exception | None = None):
+        self.finished = True
+        if error is not None:
+            self._queue.put(error)
+        self._queue.put(_END)
+
+    def _drain(self):
+        items = [self._queue.get()]
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def __iter__(self):
+        token_cache = []
+        print_len = 0
+        while True:
+            done = False
+            for item in self._drain():
+                if item is _END:
+                    done = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                token_cache.append(item)
+            text = self.tokenizer.decode(token_cache, skip_special_tokens=True)
+            if done:
+                if text[print_len:]:
+                    yield text[print_len:]
+                return
+            if text.endswith("\n"):
+                printable = text[print_len:]
+                token_cache = []
+                print_len = 0
+            else:
+                printable = text[print_len : text.rfind(" ") + 1]
+                print_len += len(printable)
+            if printable:
+                yield printable
+
+
+class BatchScheduler:
+    """Continuous batching decode loop shared by every in-flight generation.
+
+    New sequences are prefilled and merged into the running batch between
+    decode steps, finished ones are dropped from it, so a single forward pass
+    advances every active request by one token. Waiting requests are admitted
+    shortest-budget first; ``length_penalty`` (seconds per requested token)
+    ages long requests so they are delayed but never starved. Cancelled
+    sequences are dropped between steps, freeing their slot and KV cache.
+    A sequence submitted with a ``cache_key`` leaves its KV cache in
+    ``conversation_cache`` when it ends, for the next turn to resume from.
+
+    With a ``draft_model`` a lone sequence decodes speculatively: the draft
+    proposes ``num_draft_tokens`` tokens and the model checks them all in
+    one forward pass. Greedy sequences keep the draft tokens the model
+    would have picked itself, so their output is unchanged; sampled ones
+    use rejection sampling, which keeps the model's distribution.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        device,
+        max_batch_size: int = 8,
+        max_queue_size: int = 64,
+        length_penalty: float = 0.001,
+        retry_after: int = 5,
+        prefix_cache=None,
+        conversation_cache=None,
+        draft_model=None,
+        num_draft_tokens: int = 4,
+    ):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.length_penalty = length_penalty
+        self.retry_after = retry_after
+        self.prefix_cache = prefix_cache
+        self.conversation_cache = conversation_cache
+        self.draft_model = draft_model
+        self.num_draft_tokens = num_draft_tokens
+        self.draft_proposed = 0
+        self.draft_accepted = 0
+        self._draft_stream = None
+        self._draft_past = None
+        self.eos_token_ids = self._eos_token_ids()
+
+        self._pending = []
+        self._counter = itertools.count()
+        self._active: list[GenerationStream] = []
+        self._past = None
+        self._attention_mask = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._loop, name="batch-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def _eos_token_ids(self):
+        ids = set()
+        generation_config = getattr(self.model, "generation_config", None)
+        eos = getattr(generation_config, "eos_token_id", None)
+        for value in (eos, self.tokenizer.eos_token_id):
+            if isinstance(value, int):
+                ids.add(value)
+            elif value is not None:
+                ids.update(value)
+        return ids
+
+    def submit(
+        self,
+        input_ids: list[int],
+        max_new_tokens: int,
+        temperature: float | None = None,
+        top_p: float | None = None,
+        do_sample: bool = True,
+        prefix_len: int = 0,
+        cache_key=None,
+    ) -> GenerationStream:
+        generation_config = getattr(self.model, "generation_config", None)
+        if temperature is None:
+            temperature = getattr(generation_config, "temperature", None) or 1.0
+        if top_p is None:
+            top_p = getattr(generation_config, "top_p", None) or 1.0
+        stream = GenerationStream(
+            self.tokenizer,
+            input_ids,
+            max_new_tokens,
+            temperature,
+            top_p,
+            do_sample,
+            prefix_len=prefix_len,
+            cache_key=cache_key,
+        )
+        priority = time.monotonic() + self.length_penalty * (
+            max_new_tokens + len(input_ids)
+        )
+        with self._cond:
+            if len(self._pending) >= self.max_queue_size:
+                raise QueueFullError(self.retry_after)
+            heapq.heappush(self._pending, (priority, next(self._counter), stream))
+            self._cond.notify()
+        return stream
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def draft_acceptance_rate(self) -> float | None:
+        if not self.draft_proposed:
+            return None
+        return self.draft_accepted / self.draft_proposed
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._pending and not self._active:
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                self._drop_cancelled_pending()
+                admitted = []
+                while (
+                    self._pending
+                    and len(self._active) + len(admitted) < self.max_batch_size
+                ):
+                    admitted.append(heapq.heappop(self._pending)[-1])
+            try:
+                with torch.inference_mode():
+                    for stream in admitted:
+                        self._prefill(stream)
+                    self._drop_cancelled_active()
+                    if self._active:
+                        self._decode_step()
+            except Exception as exc:
+                print(f"Batch scheduler step failed: {exc}")
+                for stream in self._active + admitted:
+                    if not stream.finished:
+                        stream.end(exc)
+                self._active = []
+                self._past = None
+                self._attention_mask = None
+
+        for stream in self._active + [item[-1] for item in self._pending]:
+            stream.end(RuntimeError("Scheduler stopped"))
+
+    def _drop_cancelled_pending(self):
+        if not any(item[-1].cancelled for item in self._pending):
+            return
+        for item in self._pending:
+            if item[-1].cancelled:
+                item[-1].end()
+        self._pending = [item for item in self._pending if not item[-1].cancelled]
+        heapq.heapify(self._pending)
+
+    def _drop_cancelled_active(self):
+        keep = [
+            index for index, stream in enumerate(self._active) if not stream.cancelled
+        ]
+        if len(keep) == len(self._active):
+            return
+        for index, stream in enumerate(self._active):
+            if stream.cancelled:
+                self._retain(stream, index)
+                stream.end()
+        self._evict(keep)
+
+    def _lookup(self, stream: GenerationStream):
+        cached_len, past_key_values = 0, None
+        if self.conversation_cache is not None and stream.cache_key is not None:
+            cached_len, past_key_values = self.conversation_cache.take(
+                stream.cache_key, stream.input_ids, self.device
+            )
+        if self.prefix_cache is not None and cached_len <= stream.prefix_len:
+            prefix = self.prefix_cache.lookup(stream.input_ids)
+            if prefix[0] > cached_len:
+                cached_len, past_key_values = prefix
+        if cached_len >= len(stream.input_ids):
+            cached_len = len(stream.input_ids) - 1
+            past_key_values = _map_cache(
+                past_key_values, lambda t: t[..., :cached_len, :]
+            )
+        return cached_len, past_key_values
+
+    def _prefill(self, stream: GenerationStream):
+        cached_len, past_key_values = self._lookup(stream)
+
+        total_len = len(stream.input_ids)
+        input_ids = torch.tensor([stream.input_ids[cached_len:]], device=self.device)
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=torch.ones(
+                (1, total_len), dtype=torch.long, device=self.device
+            ),
+            position_ids=torch.arange(
+                cached_len, total_len, device=self.device
+            ).unsqueeze(0),
+            past_key_values=self._model_cache(past_key_values),
+            use_cache=True,
+        )
+        past_key_values = _to_legacy_cache(outputs.past_key_values)
+        if self.prefix_cache is not None and stream.prefix_len > cached_len:
+            prefix_len = stream.prefix_len
+            self.prefix_cache.insert(
+                stream.input_ids[:prefix_len],
+                _map_cache(past_key_values, lambda t: t[..., :prefix_len, :].clone()),
+            )
+
+        token = self._sample(outputs.logits[:, -1, :], [stream])[0]
+        if self._emit(stream, token, past_key_values=past_key_values):
+            return
+        self._merge(stream, past_key_values)
+
+    def _merge(self, stream: GenerationStream, past_key_values):
+        new_len = past_key_values[0][0].shape[-2]
+        new_mask = torch.ones((1, new_len), dtype=torch.long, device=self.device)
+        if self._past is None:
+            self._past = past_key_values
+            self._attention_mask = new_mask
+            self._active = [stream]
+            return
+
+        batch_len = self._attention_mask.shape[-1]
+        target = max(batch_len, new_len)
+        batch_past = _left_pad_cache(self._past, target - batch_len)
+        past_key_values = _left_pad_cache(past_key_values, target - new_len)
+        self._past = tuple(
+            tuple(torch.cat([a, b], dim=0) for a, b in zip(batch_layer, new_layer))
+            for batch_layer, new_layer in zip(batch_past, past_key_values)
+        )
+        self._attention_mask = torch.cat(
+            [
+                F.pad(self._attention_mask, (target - batch_len, 0)),
+                F.pad(new_mask, (target - new_len, 0)),
+            ],
+            dim=0,
+        )
+        self._active.append(stream)
+
+    def _decode_step(self):
+        if self.draft_model is not None and len(self._active) == 1:
+            self._speculative_step(self._active[0])
+            return
+        input_ids = torch.tensor(
+            [[stream.next_token] for stream in self._active], device=self.device
+        )
+        position_ids = torch.tensor(
+            [[stream.position] for stream in self._active], device=self.device
+        )
+        attention_mask = F.pad(self._attention_mask, (0, 1), value=1)
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            position_ids=position_ids,
+            past_key_values=self._model_cache(self._past),
+            use_cache=True,
+        )
+        self._past = _to_legacy_cache(outputs.past_key_values)
+        self._attention_mask = attention_mask
+
+        tokens = self._sample(outputs.logits[:, -1, :], self._active)
+        keep = []
+        for index, (stream, token) in enumerate(zip(self._active, tokens)):
+            stream.position += 1
+            if not self._emit(stream, token, index=index):
+                keep.append(index)
+        if len(keep) != len(self._active):
+            self._evict(keep)
+
+    def _model_cache(self, past_key_values, model=None):
+        if past_key_values is None:
+            return None
+        if getattr(model or self.model, "_supports_cache_class", False):
+            return DynamicCache.from_legacy_cache(past_key_values)
+        return past_key_values
+
+    def _draft(self, stream: GenerationStream):
+        """Proposes draft tokens after ``stream.next_token``.
+
+        Returns the tokens and, for sampled sequences, the draft's
+        distribution for each. The draft cache is caught up on the tokens
+        fed to the model since the last round and left one token short of
+        the last proposal.
+        """
+        if self._draft_stream is not stream:
+            self._draft_stream = stream
+            self._draft_past = None
+        tokens = stream.input_ids + stream.generated_ids
+        draft_len = 0 if self._draft_past is None else self._draft_past[0][0].shape[-2]
+        input_ids = tokens[draft_len : stream.position + 1]
+        position = draft_len
+        proposals, probs = [], []
+        remaining = stream.max_new_tokens - len(stream.generated_ids)
+        for _ in range(min(self.num_draft_tokens, remaining - 1)):
+            end = position + len(input_ids)
+            outputs = self.draft_model(
+                input_ids=torch.tensor([input_ids], device=self.device),
+                attention_mask=torch.ones(
+                    (1, end), dtype=torch.long, device=self.device
+                ),
+                position_ids=torch.arange(position, end, device=self.device).unsqueeze(
+                    0
+                ),
+                past_key_values=self._model_cache(self._draft_past, self.draft_model),
+                use_cache=True,
+            )
+            self._draft_past = _to_legacy_cache(outputs.past_key_values)
+            logits = outputs.logits[0, -1, :].float()
+            if stream.do_sample:
+                probs.append(self._sampling_probs(logits, stream))
+                token = int(torch.multinomial(probs[-1], num_samples=1))
+            else:
+                token = int(logits.argmax())
+            proposals.append(token)
+            input_ids = [token]
+            position = end
+        return proposals, probs
+
+    def _speculative_step(self, stream: GenerationStream):
+        proposals, draft_probs = self._draft(stream)
+        batch_len = self._attention_mask.shape[-1]
+        verify_len = len(proposals) + 1
+        attention_mask = F.pad(self._attention_mask, (0, verify_len), value=1)
+        outputs = self.model(
+            input_ids=torch.tensor(
+                [[stream.next_token] + proposals], device=self.device
+            ),
+            attention_mask=attention_mask,
+            position_ids=torch.arange(
+                stream.position, stream.position + verify_len, device=self.device
+            ).unsqueeze(0),
+            past_key_values=self._model_cache(self._past),
+            use_cache=True,
+        )
+        logits = outputs.logits[0].float()
+
+        accepted = 0
+        next_token = None
+        for index, token in enumerate(proposals):
+            if not stream.do_sample:
+                if int(logits[index].argmax()) != token:
+                    break
+            else:
+                probs = self._sampling_probs(logits[index], stream)
+                draft = draft_probs[index]
+                if torch.rand(()) * draft[token] > probs[token]:
+                    residual = (probs - draft).clamp(min=0)
+                    if residual.sum() <= 0:
+                        residual = probs
+                    next_token = int(torch.multinomial(residual, num_samples=1))
+                    break
+            accepted += 1
+        if next_token is None:
+            if stream.do_sample:
+                probs = self._sampling_probs(logits[accepted], stream)
+                next_token = int(torch.multinomial(probs, num_samples=1))
+            else:
+                next_token = int(logits[accepted].argmax())
+
+        # keep the cache up to the last accepted draft token
+        keep = batch_len + 1 + accepted
+        self._past = _map_cache(
+            _to_legacy_cache(outputs.past_key_values), lambda t: t[..., :keep, :]
+        )
+        self._attention_mask = attention_mask[:, :keep]
+        draft_keep = stream.position + 1 + accepted
+        self._draft_past = _map_cache(
+            self._draft_past, lambda t: t[..., :draft_keep, :]
+        )
+        stream.draft_proposed += len(proposals)
+        stream.draft_accepted += accepted
+        self.draft_proposed += len(proposals)
+        self.draft_accepted += accepted
+
+        for token in proposals[:accepted] + [next_token]:
+            stream.position += 1
+            if self._emit(stream, token, index=0):
+                self._evict([])
+                return
+
+    def _sampling_probs(self, logits: torch.Tensor, stream: GenerationStream):
+        """The temperature and top-p filtered distribution ``_sample`` draws from."""
+        probs = torch.softmax(logits / stream.temperature, dim=-1)
+        sorted_probs, sorted_index = probs.sort(dim=-1, descending=True)
+        cumulative = sorted_probs.cumsum(dim=-1)
+        sorted_probs = sorted_probs.masked_fill(
+            cumulative - sorted_probs > stream.top_p, 0.0
+        )
+        probs = torch.zeros_like(probs).scatter(-1, sorted_index, sorted_probs)
+        return probs / probs.sum()
+
+    def _emit(
+        self, stream: GenerationStream, token: int, index=None, past_key_values=None
+    ) -> bool:
+        if token not in self.eos_token_ids:
+            stream.push(token)
+            stream.next_token = token
+            if len(stream.generated_ids) < stream.max_new_tokens:
+                return False
+        # retained before the end is signalled, so a follow-up turn finds it
+        self._retain(stream, index, past_key_values)
+        stream.end()
+        return True
+
+    def _retain(self, stream: GenerationStream, index=None, past_key_values=None):
+        """Leaves a finished sequence's KV cache in the conversation cache.
+
+        The cache covers the prompt and every generated token fed back so
+        far; ``index`` picks the sequence's row of the running batch.
+        """
+        if self.conversation_cache is None or stream.cache_key is None:
+            return
+        if index is not None:
+            length = int(self._attention_mask[index].sum())
+            past_key_values = _map_cache(
+                self._past, lambda t: t[index : index + 1, ..., -length:, :].clone()
+            )
+        length = past_key_values[0][0].shape[-2]
+        token_ids = (stream.input_ids + stream.generated_ids)[:length]
+        if len(token_ids) < length:
+            # a speculative step can end on a token ahead of the cache's end
+            past_key_values = _map_cache(
+                past_key_values, lambda t: t[..., : len(token_ids), :]
+            )
+        self.conversation_cache.put(
+            stream.cache_key, token_ids, past_key_values, self.device
+        )
+
+    def _evict(self, keep: list[int]):
+        if not keep:
+            self._draft_stream = None
+            self._draft_past = None
+            self._active = []
+            self._past = None
+            self._attention_mask = None
+            return
+        index = torch.tensor(keep, device=self.device)
+        attention_mask = self._attention_mask.index_select(0, index)
+        start = int(attention_mask.any(dim=0).nonzero()[0])
+        self._attention_mask = attention_mask[:, start:]
+        self._past = _map_cache(
+            self._past, lambda t: t.index_select(0, index)[..., start:, :]
+        )
+        self._active = [self._active[i] for i in keep]
+
+    def _sample(self, logits: torch.Tensor, streams: list[GenerationStream]):
+        logits = logits.float()
+        greedy = logits.argmax(dim=-1)
+        if not any(stream.do_sample for stream in streams):
+            return greedy.tolist()
+
+        temperature = torch.tensor(
+            [stream.temperature if stream.do_sample else 1.0 for stream in streams],
+            device=logits.device,
+        )
+        top_p = torch.tensor([stream.top_p for stream in streams], device=logits.device)
+        probs = torch.softmax(logits / temperature[:, None], dim=-1)
+        sorted_probs, sorted_index = probs.sort(dim=-1, descending=True)
+        cumulative = sorted_probs.cumsum(dim=-1)
+        sorted_probs = sorted_probs.masked_fill(
+            cumulative - sorted_probs > top_p[:, None], 0.0
+        )
+        choice = torch.multinomial(sorted_probs, num_samples=1)
+        sampled = sorted_index.gather(-1, choice).squeeze(-1)
+        do_sample = torch.tensor(
+            [stream.do_sample for stream in streams], device=logits.device
+        )
+        return torch.where(do_sample, sampled, greedy).tolist()
@@ -76,10 +76,12 @@ class UserPatch(BaseModel):
 
 
 class ChatRequest(BaseModel):
-    user_prompt: str
-    top_p: Optional[float] = 0.9
-    temperature: Optional[float] = 0.1
-    max_new_tokens: Optional[int] = 512
+    prompt: str
+    system_prompt: str = ""
+    chat_id: Optional[int] = None
+    top_p: float = Field(0.9, gt=0, le=1)
+    temperature: float = Field(0.1, ge=0, le=2)
+    max_new_tokens: int = Field(512, gt=0)
 
 
 class MessageBase(BaseModel):
@@ -103,17 +105,50 @@ class ChatBase(BaseModel):
 
 class ChatList(BaseModel):
     chats: List[ChatBase]
-    total: int
+    total: Optional[int] = None
+    total_capped: bool = False
+    next_cursor: Optional[str] = None
+
+
+class ChatSummary(BaseModel):
+    id: int
+    user_id: int
+    created_at: datetime
+    title: Optional[str] = None
+    message_count: int
+
+    class Config:
+        orm_mode = True
+
+
+class ChatSummaryList(BaseModel):
+    chats: List[ChatSummary]
+    total: Optional[int] = None
+    total_capped: bool = False
+    next_cursor: Optional[str] = None
 
 
 class MessageList(BaseModel):
     messages: List[MessageBase]
-    total: int
+    total: Optional[int] = None
+    total_capped: bool = False
+    next_cursor: Optional[str] = None
 
 
 class ArchiveRequest(BaseModel):
     user_id: int
 
 
+class PurgeRequest(BaseModel):
+    user_id: int
+    archived_only: bool = True
+
+
 class CodeExecutionRequest(BaseModel):
     code: str
+
+
+class BatchExecutionRequest(BaseModel):
+    code: Optional[str] = None
+    inputs: Optional[List[str]] = None
+    snippets: Optional[List[str]] = None
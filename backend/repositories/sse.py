@@ -0,0 +1,392 @@
+import asyncio
+import json
+import threading
+import time
+
+import aioredis
+
+TERMINAL_EVENTS = ("done", "error")
+_END = object()
+
+
+def format_event(event_id: int, event: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _shielded(coro):
+    """Awaits a Redis call in a task of its own.
+
+    A caller cancelled mid-reply would otherwise put the connection back in
+    the pool with the rest of the reply still unread.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        raise
+
+
+class _Replay:
+    def __init__(self, owner: int, expires: float):
+        self.owner = owner
+        self.expires = expires
+        self.events = []
+        self.listeners = 0
+        self.changed = asyncio.Condition()
+
+
+class MemoryReplayStore:
+    """Keeps each generation's events in-process for ``ttl`` seconds."""
+
+    def __init__(self, ttl: int = 300, max_generations: int = 1000):
+        self.ttl = ttl
+        self.max_generations = max_generations
+        self._replays = {}
+
+    def _prune(self):
+        now = time.monotonic()
+        for generation_id in [
+            key for key, replay in self._replays.items() if replay.expires <= now
+        ]:
+            del self._replays[generation_id]
+        while len(self._replays) >= self.max_generations:
+            del self._replays[next(iter(self._replays))]
+
+    def _get(self, generation_id: str):
+        replay = self._replays.get(generation_id)
+        if replay is None or replay.expires <= time.monotonic():
+            return None
+        return replay
+
+    async def create(self, generation_id: str, owner: int):
+        self._prune()
+        self._replays[generation_id] = _Replay(owner, time.monotonic() + self.ttl)
+
+    async def owner(self, generation_id: str):
+        replay = self._get(generation_id)
+        return None if replay is None else replay.owner
+
+    async def append(self, generation_id: str, event: str, data: dict) -> int:
+        replay = self._replays.get(generation_id)
+        if replay is None:
+            # evicted to make room; nobody can resume it any more
+            return 0
+        replay.events.append((event, data))
+        replay.expires = time.monotonic() + self.ttl
+        async with replay.changed:
+            replay.changed.notify_all()
+        return len(replay.events)
+
+    async def listen(self, generation_id: str, delta: int):
+        replay = self._get(generation_id)
+        if replay is not None:
+            replay.listeners += delta
+
+    async def listeners(self, generation_id: str) -> int:
+        replay = self._get(generation_id)
+        return 0 if replay is None else replay.listeners
+
+    async def read(self, generation_id: str, after: int, timeout: float):
+        """Events after id ``after`` as ``(id, event, data)``; None once expired."""
+        replay = self._get(generation_id)
+        if replay is None:
+            return None
+        if len(replay.events) <= after:
+            async with replay.changed:
+                try:
+                    await asyncio.wait_for(
+                        replay.changed.wait_for(lambda: len(replay.events) > after),
+                        timeout,
+                    )
+                except asyncio.TimeoutError:
+                    return []
+        return [
+            (index + 1, event, data)
+            for index, (event, data) in enumerate(replay.events)
+            if index >= after
+        ]
+
+
+class RedisReplayStore:
+    """Keeps events in a Redis stream so any replica can serve a resume.
+
+    Readers in the publishing process wait on a local condition; only a
+    resume that lands on another replica blocks on ``XREAD``.
+    """
+
+    def __init__(self, redis, ttl: int = 300, prefix: str = "generation"):
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self._local = {}
+
+    def _keys(self, generation_id: str):
+        base = f"{self.prefix}:{generation_id}"
+        return f"{base}:owner", f"{base}:events"
+
+    def _listeners_key(self, generation_id: str):
+        return f"{self.prefix}:{generation_id}:listeners"
+
+    async def create(self, generation_id: str, owner: int):
+        owner_key, _ = self._keys(generation_id)
+        await self.redis.set(owner_key, owner, ex=self.ttl)
+        self._local[generation_id] = [0, asyncio.Condition()]
+
+    async def owner(self, generation_id: str):
+        owner_key, _ = self._keys(generation_id)
+        owner = await self.redis.get(owner_key)
+        return None if owner is None else int(owner)
+
+    async def append(self, generation_id: str, event: str, data: dict) -> int:
+        owner_key, events_key = self._keys(generation_id)
+        local = self._local[generation_id]
+        event_id = local[0] + 1
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                events_key,
+                {"event": event, "data": json.dumps(data)},
+                id=f"0-{event_id}",
+            )
+            pipe.expire(events_key, self.ttl)
+            pipe.expire(owner_key, self.ttl)
+            await pipe.execute()
+        local[0] = event_id
+        if event in TERMINAL_EVENTS:
+            del self._local[generation_id]
+        async with local[1]:
+            local[1].notify_all()
+        return event_id
+
+    async def listen(self, generation_id: str, delta: int):
+        key = self._listeners_key(generation_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.incrby(key, delta)
+        pipe.expire(key, self.ttl)
+        await _shielded(pipe.execute())
+
+    async def listeners(self, generation_id: str) -> int:
+        return int(await self.redis.get(self._listeners_key(generation_id)) or 0)
+
+    @staticmethod
+    def _parse(entries):
+        return [
+            (int(entry_id.split("-")[1]), fields["event"], json.loads(fields["data"]))
+            for entry_id, fields in entries
+        ]
+
+    async def read(self, generation_id: str, after: int, timeout: float):
+        owner_key, events_key = self._keys(generation_id)
+        if not await _shielded(self.redis.exists(owner_key)):
+            return None
+        local = self._local.get(generation_id)
+        if local is None:
+            streams = await _shielded(
+                self.redis.xread(
+                    {events_key: f"0-{after}"}, block=max(1, int(timeout * 1000))
+                )
+            )
+            return [event for _, entries in streams for event in self._parse(entries)]
+        if local[0] <= after:
+            async with local[1]:
+                try:
+                    await asyncio.wait_for(
+                        local[1].wait_for(lambda: local[0] > after), timeout
+                    )
+                except asyncio.TimeoutError:
+                    return []
+        return self._parse(
+            await _shielded(self.redis.xrange(events_key, min=f"0-{after + 1}"))
+        )
+
+
+class GenerationPublisher:
+    """Drains a generation into the replay store, coalescing its text.
+
+    Text is flushed as one ``token`` event once ``window`` seconds have
+    passed since the first unflushed fragment or ``max_bytes`` have built
+    up. A generation nobody has listened to for ``orphan_timeout`` seconds
+    is cancelled through ``stream.cancel()``; until then a client that
+    dropped can reconnect and resume from the store.
+    """
+
+    def __init__(
+        self,
+        store,
+        window: float = 0.05,
+        max_bytes: int = 512,
+        orphan_timeout: float = 30.0,
+    ):
+        self.store = store
+        self.window = window
+        self.max_bytes = max_bytes
+        self.orphan_timeout = orphan_timeout
+        self.check_interval = min(1.0, orphan_timeout / 2)
+        self._tasks = set()
+
+    async def start(self, generation_id: str, owner: int, fragments, stream):
+        await self.store.create(generation_id, owner)
+        await self.store.append(
+            generation_id, "start", {"generation_id": generation_id}
+        )
+        task = asyncio.create_task(self._publish(generation_id, fragments, stream))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _drain_in_thread(self, fragments, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+
+        def drain():
+            try:
+                for text in fragments:
+                    loop.call_soon_threadsafe(queue.put_nowait, text)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, _END)
+
+        threading.Thread(target=drain, name="generation-publisher", daemon=True).start()
+
+    async def _check_listeners(self, generation_id: str, stream, orphaned_since):
+        """Returns when the generation was last seen without listeners."""
+        if await self.store.listeners(generation_id) > 0:
+            return None
+        now = time.monotonic()
+        if orphaned_since is None:
+            return now
+        if now - orphaned_since >= self.orphan_timeout and not stream.cancelled:
+            print(f"Cancelling generation {generation_id}, nobody is listening")
+            stream.cancel()
+        return orphaned_since
+
+    async def _publish(self, generation_id: str, fragments, stream):
+        queue = asyncio.Queue()
+        self._drain_in_thread(fragments, queue)
+        pending = []
+        pending_bytes = 0
+        flush_at = None
+        check_at = None
+        orphaned_since = None
+        if self.orphan_timeout > 0:
+            check_at = time.monotonic() + self.check_interval
+
+        async def flush():
+            nonlocal pending, pending_bytes, flush_at
+            if pending:
+                await self.store.append(
+                    generation_id, "token", {"text": "".join(pending)}
+                )
+            pending, pending_bytes, flush_at = [], 0, None
+
+        try:
+            while True:
+                deadlines = [when for when in (flush_at, check_at) if when is not None]
+                timeout = None
+                if deadlines:
+                    timeout = max(0.0, min(deadlines) - time.monotonic())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    now = time.monotonic()
+                    if flush_at is not None and flush_at <= now:
+                        await flush()
+                    if check_at is not None and check_at <= now:
+                        check_at = now + self.check_interval
+                        orphaned_since = await self._check_listeners(
+                            generation_id, stream, orphaned_since
+                        )
+                    continue
+                if item is _END:
+                    await flush()
+                    done = {"cancelled": stream.cancelled}
+                    if stream.draft_proposed:
+                        done["draft_acceptance_rate"] = (
+                            stream.draft_accepted / stream.draft_proposed
+                        )
+                    await self.store.append(generation_id, "done", done)
+                    return
+                if isinstance(item, Exception):
+                    await flush()
+                    print(f"Generation {generation_id} failed: {item}")
+                    await self.store.append(
+                        generation_id, "error", {"detail": "Generation failed"}
+                    )
+                    return
+                pending.append(item)
+                pending_bytes += len(item.encode())
+                if flush_at is None:
+                    flush_at = time.monotonic() + self.window
+                if pending_bytes >= self.max_bytes:
+                    await flush()
+        except Exception as e:
+            print(f"Publishing generation {generation_id} failed: {e}")
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def replay_events(store, generation_id: str, after: int, keepalive: float = 15.0):
+    """Yields stored events after ``after``, then live ones until the end.
+
+    The reader counts as a listener of the generation while it runs.
+    """
+    try:
+        await store.listen(generation_id, 1)
+    except aioredis.RedisError as e:
+        print(f"Reading generation {generation_id} failed: {e}")
+        yield format_event(after, "error", {"detail": "Stream unavailable"})
+        return
+    try:
+        while True:
+            try:
+                events = await store.read(generation_id, after, keepalive)
+            except aioredis.RedisError as e:
+                print(f"Reading generation {generation_id} failed: {e}")
+                yield format_event(after, "error", {"detail": "Stream unavailable"})
+                return
+            if events is None:
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event, data in events:
+                yield format_event(event_id, event, data)
+                after = event_id
+                if event in TERMINAL_EVENTS:
+                    return
+    finally:
+        try:
+            await store.listen(generation_id, -1)
+        except aioredis.RedisError as e:
+            print(f"Releasing generation {generation_id} failed: {e}")
+
+
+replay_store = MemoryReplayStore()
+publisher = GenerationPublisher(replay_store)
+
+
+def init(
+    backend: str = "memory",
+    redis=None,
+    ttl: int = 300,
+    window: float = 0.05,
+    max_bytes: int = 512,
+    orphan_timeout: float = 30.0,
+):
+    global replay_store, publisher
+    if backend == "redis":
+        replay_store = RedisReplayStore(redis, ttl=ttl)
+    elif backend == "memory":
+        replay_store = MemoryReplayStore(ttl=ttl)
+    else:
+        raise ValueError(f"Unknown generation replay backend: {backend}")
+    publisher = GenerationPublisher(
+        replay_store,
+        window=window,
+        max_bytes=max_bytes,
+        orphan_timeout=orphan_timeout,
+    )
+    return publisher
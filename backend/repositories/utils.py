@@ -1,6 +1,7 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 import sys
+from collections import OrderedDict
+
+from repositories.backends import Cuda4BitBackend, InferenceBackend
 
 
 class ChatModel:
@@ -8,50 +9,46 @@ class ChatModel:
         self,
         model="./CodeLlama-7b-Instruct-hf",
         fallback_model="./CodeLlama-13b-Instruct-hf",
+        backend: InferenceBackend = None,
+        max_chats: int = 1000,
     ):
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,  # use 4-bit quantization
-            bnb_4bit_compute_dtype=torch.float16,
-            bnb_4bit_use_double_quant=True,
-        )
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        backend = backend or Cuda4BitBackend()
+        self.device = backend.device
 
         try:
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model,
-                quantization_config=quantization_config,
-                device_map=self.device,
-            )
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                model, use_fast=True, padding_side="left"
-            )
+            self.model, self.tokenizer = backend.load(model)
         except Exception as e:
             print(
                 f"model {model} not found. Trying to load {fallback_model} model: {e}"
             )
             try:
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    fallback_model,
-                    quantization_config=quantization_config,
-                    device_map=self.device,
-                )
-                self.tokenizer = AutoTokenizer.from_pretrained(
-                    fallback_model, use_fast=True, padding_side="left"
-                )
+                self.model, self.tokenizer = backend.load(fallback_model)
             except Exception as e:
                 print(f"Failed to load fallback model {fallback_model}: {e}")
                 sys.exit("Error: No model found. Terminating program.")
 
-        self.history = []
+        # chat id -> recent (prompt, response) turns, least recently used first
+        self.histories = OrderedDict()
         self.history_length = 1
+        self.max_chats = max_chats
         self.DEFAULT_SYSTEM_PROMPT = """\
         You are a helpful, respectful and honest assistant with a deep knowledge of code and software design. Always answer as helpfully as possible, while being safe. Your answers should not include any harmful, unethical, racist, sexist, toxic, dangerous, or illegal content. Please ensure that your responses are socially unbiased and positive in nature.\n\nIf a question does not make any sense, or is not factually coherent, explain why instead of answering something not correct. If you don't know the answer to a question, please don't share false information.\
         """
 
-    def append_to_history(self, user_prompt, response):
-        self.history.append((user_prompt, response))
-        if len(self.history) > self.history_length:
-            self.history.pop(0)
+    def get_history(self, chat_id):
+        if chat_id not in self.histories:
+            return []
+        self.histories.move_to_end(chat_id)
+        return self.histories[chat_id]
+
+    def append_to_history(self, chat_id, user_prompt, response):
+        history = self.histories.setdefault(chat_id, [])
+        self.histories.move_to_end(chat_id)
+        history.append((user_prompt, response))
+        if len(history) > self.history_length:
+            history.pop(0)
+        while len(self.histories) > self.max_chats:
+            self.histories.popitem(last=False)
 
     def generate(
         self,
@@ -60,10 +57,16 @@ class ChatModel:
         top_p=0.9,
         temperature=0.1,
         max_new_tokens=16384,
+        chat_id=None,
     ):
+        """Answers ``user_prompt``, continuing ``chat_id``'s history if given.
+
+        Without a chat id each call stands alone.
+        """
         texts = [f"<s>[INST] <<SYS>>\n{system_prompt}\n<</SYS>>\n\n"]
         do_strip = False
-        for old_prompt, old_response in self.history:
+        history = self.get_history(chat_id) if chat_id is not None else []
+        for old_prompt, old_response in history:
             old_prompt = old_prompt.strip() if do_strip else old_prompt
             do_strip = True
             texts.append(f"{old_prompt} [/INST] {old_response.strip()} </s><s>[INST] ")
@@ -87,5 +90,6 @@ class ChatModel:
         )
         output = output[0].to(self.device)
         response = self.tokenizer.decode(output[inputs["input_ids"].shape[1] : -1])
-        self.append_to_history(user_prompt, response)
+        if chat_id is not None:
+            self.append_to_history(chat_id, user_prompt, response)
         return response
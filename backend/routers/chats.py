@@ -1,25 +1,85 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from repositories import models, auths, crud, schemas
-from repositories.database import get_db
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from repositories import auths, async_crud, schemas
+from repositories.database import AsyncSessionLocal, get_async_db
 from dotenv import load_dotenv, find_dotenv
-from typing import Annotated, List
+from typing import Annotated, List, Literal, Optional
+import os
 
 load_dotenv(find_dotenv())
 
+chat_purge_chunk_size = int(os.getenv("CHAT_PURGE_CHUNK_SIZE", 500))
+
 router = APIRouter()
 
 
+def check_chat_owner(current_user: schemas.User, user_id: int):
+    if user_id != current_user.id and not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to manage another user's chats",
+        )
+
+
 @router.get("/chats", response_model=schemas.ChatList)
 async def read_chats(
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
     user_id: int,
     page: int = Query(1, gt=0),
     page_size: int = Query(5, gt=0, le=50),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    count: Literal["exact", "capped", "none"] = "exact",
+    db: AsyncSession = Depends(get_async_db),
+):
+    check_chat_owner(current_user, user_id)
+    try:
+        chats, total, capped, next_cursor = await async_crud.get_chats_paginated(
+            db, user_id, page, page_size, cursor, count
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "chats": chats,
+        "total": total,
+        "total_capped": capped,
+        "next_cursor": next_cursor,
+    }
+
+
+@router.get("/chats/summaries", response_model=schemas.ChatSummaryList)
+async def read_chat_summaries(
+    current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
+    user_id: int,
+    page: int = Query(1, gt=0),
+    page_size: int = Query(20, gt=0, le=100),
+    cursor: Optional[str] = None,
+    count: Literal["exact", "capped", "none"] = "exact",
+    db: AsyncSession = Depends(get_async_db),
 ):
-    chats, total = crud.get_chats_paginated(db, user_id, page, page_size)
-    return {"chats": chats, "total": total}
+    check_chat_owner(current_user, user_id)
+    try:
+        chats, total, capped, next_cursor = (
+            await async_crud.get_chat_summaries_paginated(
+                db, user_id, page, page_size, cursor, count
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "chats": chats,
+        "total": total,
+        "total_capped": capped,
+        "next_cursor": next_cursor,
+    }
+
+
+@router.post("/chats", response_model=schemas.ChatBase)
+async def create_chat(
+    current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Starts an empty chat; pass its id as ``chat_id`` to ``/generate/``."""
+    return await async_crud.create_chat(db, current_user.id)
 
 
 @router.get("/chats/{chat_id}/messages", response_model=schemas.MessageList)
@@ -28,23 +88,36 @@ async def read_chat_messages(
     chat_id: int,
     page: int = Query(1, gt=0),
     page_size: int = Query(5, gt=0, le=50),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    count: Literal["exact", "capped", "none"] = "exact",
+    db: AsyncSession = Depends(get_async_db),
 ):
-    messages, total = crud.get_chat_messages_paginated(db, chat_id, page, page_size)
-    return {"messages": messages, "total": total}
+    try:
+        messages, total, capped, next_cursor = (
+            await async_crud.get_chat_messages_paginated(
+                db, chat_id, page, page_size, cursor, count
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "messages": messages,
+        "total": total,
+        "total_capped": capped,
+        "next_cursor": next_cursor,
+    }
 
 
 @router.delete("/chats/{chat_id}", response_model=schemas.ChatBase)
 async def delete_chat(
     chat_id: int,
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    chat = db.query(models.Chat).filter(models.Chat.id == chat_id).first()
-    if not chat:
+    chat = await async_crud.get_chat(db, chat_id)
+    if not chat or chat.user_id != current_user.id:
         raise HTTPException(status_code=404, detail="Chat not found")
-    db.delete(chat)
-    db.commit()
+    await async_crud.delete_chat(db, chat_id, current_user.id)
     return chat
 
 
@@ -52,11 +125,25 @@ async def delete_chat(
 async def archive_all_chats(
     request: schemas.ArchiveRequest,
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+):
+    check_chat_owner(current_user, request.user_id)
+    archived = await async_crud.archive_chats(db, request.user_id)
+    return {"message": "All chats archived successfully", "archived": archived}
+
+
+@router.post("/chats/purge", response_model=dict, status_code=status.HTTP_202_ACCEPTED)
+async def purge_chats(
+    request: schemas.PurgeRequest,
+    background_tasks: BackgroundTasks,
+    current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
 ):
-    user_id = request.user_id
-    chats = db.query(models.Chat).filter(models.Chat.user_id == user_id).all()
-    for chat in chats:
-        db.delete(chat)
-    db.commit()
-    return {"message": "All chats archived successfully"}
+    check_chat_owner(current_user, request.user_id)
+    background_tasks.add_task(
+        async_crud.purge_chats,
+        AsyncSessionLocal,
+        request.user_id,
+        request.archived_only,
+        chat_purge_chunk_size,
+    )
+    return {"message": "Chat deletion scheduled"}
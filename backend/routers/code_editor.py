@@ -1,13 +1,46 @@
+from contextlib import AsyncExitStack
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import List
 
 from repositories import auths, schemas
+from repositories.executor_client import (
+    ExecutorUnavailableError,
+    get_executor_client,
+)
 
 import httpx
 
 router = APIRouter()
 
 
+def executor_error(response: httpx.Response) -> HTTPException:
+    try:
+        error_message = response.json().get("detail", "Unknown error occurred")
+    except ValueError:
+        error_message = "Unknown error occurred"
+    print(f"Error from code execution service: {error_message}")
+    return HTTPException(
+        status_code=response.status_code,
+        detail=error_message,
+        headers={
+            key: value
+            for key, value in response.headers.items()
+            if key.lower() == "retry-after"
+        },
+    )
+
+
+def unavailable_error(e: ExecutorUnavailableError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 @router.post("/execute_code")
 async def execute_code(
     request: schemas.CodeExecutionRequest,
@@ -15,26 +48,74 @@ async def execute_code(
 ):
     code = request.code
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://code_execution_service:8001/execute_code", json={"code": code}
-            )
-            if response.status_code != 200:
-                response_data = response.json()
-                error_message = response_data.get("detail", "Unknown error occurred")
-                print(f"Error from code execution service: {error_message}")
-                raise HTTPException(
-                    status_code=response.status_code, detail=error_message
-                )
-            response_data = response.json()
+        response = await get_executor_client().post(
+            "/execute_code", json={"code": code}
+        )
+    except ExecutorUnavailableError as e:
+        raise unavailable_error(e)
+    except httpx.RequestError as e:
+        print(f"Request to code execution service failed: {e!r}")
+        raise HTTPException(status_code=500, detail="Request error occurred")
+
+    if response.status_code != 200:
+        raise executor_error(response)
+    return response.json()
+
+
+@router.post("/execute_code/batch")
+async def execute_code_batch(
+    request: schemas.BatchExecutionRequest,
+    current_user: schemas.User = Depends(auths.get_current_active_user),
+):
+    """Runs one code body against several stdin inputs, or several snippets."""
+    try:
+        response = await get_executor_client().post(
+            "/execute_code/batch", json=request.model_dump(exclude_none=True)
+        )
+    except ExecutorUnavailableError as e:
+        raise unavailable_error(e)
     except httpx.RequestError as e:
+        print(f"Request to code execution service failed: {e!r}")
         raise HTTPException(status_code=500, detail="Request error occurred")
-    except httpx.HTTPStatusError as e:
-        raise HTTPException(
-            status_code=response.status_code, detail="HTTP error occurred"
+
+    if response.status_code != 200:
+        raise executor_error(response)
+    return response.json()
+
+
+@router.post("/execute_code/stream")
+async def execute_code_stream(
+    request: schemas.CodeExecutionRequest,
+    current_user: schemas.User = Depends(auths.get_current_active_user),
+):
+    """Relays the executor's server-sent events without buffering them."""
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            get_executor_client().stream(
+                "/execute_code/stream", json={"code": request.code}
+            )
         )
+    except ExecutorUnavailableError as e:
+        raise unavailable_error(e)
+    except httpx.RequestError as e:
+        print(f"Request to code execution service failed: {e!r}")
+        raise HTTPException(status_code=500, detail="Request error occurred")
+
+    if response.status_code != 200:
+        await response.aread()
+        await stack.aclose()
+        raise executor_error(response)
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async def relay():
+        async with stack:
+            async for chunk in response.aiter_raw():
+                yield chunk
 
-    return response_data
+    # also runs when the client disconnects before the relay starts
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(stack.aclose),
+    )
@@ -1,14 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from repositories import auths, crud, schemas
-from repositories.database import get_db
+from repositories import auths, async_crud, principal_cache, schemas
+from repositories.database import get_async_db
 
 from typing import Annotated
 
 from fastapi.responses import JSONResponse
-from fastapi_limiter.depends import RateLimiter
-
+from repositories.rate_limit import RateLimiter
 
 router = APIRouter()
 
@@ -25,31 +24,34 @@ async def get_resource():
 async def create_item_for_user(
     item: schemas.ItemCreate,
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return crud.create_item(db=db, item=item, user_id=current_user.id)
+    db_item = await async_crud.create_item(db=db, item=item, user_id=current_user.id)
+    await principal_cache.invalidate_user(current_user.username)
+    return db_item
 
 
 @router.get("/users/me/items/")
 async def read_own_items(
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return crud.get_items(db=db, user_id=current_user.id)
+    return await async_crud.get_items(db=db, user_id=current_user.id)
 
 
 @router.delete("/users/me/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_item(
     item_id: int,
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    item = crud.get_item(db=db, item_id=item_id, user_id=current_user.id)
+    item = await async_crud.get_item(db=db, item_id=item_id, user_id=current_user.id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
 
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
+    await principal_cache.invalidate_user(current_user.username)
     return JSONResponse(
         content={"message": "Item deleted successfully"},
         status_code=status.HTTP_204_NO_CONTENT,
@@ -63,7 +65,7 @@ async def delete_item(
 async def read_protected_own_items(
     request: Request,
     current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    items = crud.get_items(db=db, user_id=current_user.id)
+    items = await async_crud.get_items(db=db, user_id=current_user.id)
     return {"message": "You are within rate limit", "items": items}
@@ -1,20 +1,19 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 from jose import JWTError, jwt
 
-from repositories import auths, crud, schemas, models
-from repositories.database import get_db
+from repositories import auths, async_crud, principal_cache, schemas
+from repositories.database import get_async_db
 
 
 from datetime import timedelta
 from typing import Annotated, List
 
 from fastapi.responses import JSONResponse
-from fastapi_limiter.depends import RateLimiter
-
+from repositories.rate_limit import RateLimiter
 
 router = APIRouter()
 
@@ -22,9 +21,9 @@ router = APIRouter()
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     login_data: schemas.LoginData,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    user, error_message = auths.authenticate_user(
+    user, error_message = await auths.authenticate_user(
         db, login_data.username, login_data.password
     )
 
@@ -48,13 +47,13 @@ async def login_for_access_token(
 
 
 @router.post("/refresh-token", response_model=schemas.Token)
-async def refresh_access_token(token: str, db: Session = Depends(get_db)):
+async def refresh_access_token(token: str, db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, auths.SECRET_KEY, algorithms=[auths.ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=400, detail="Invalid token")
-        user = crud.get_user(db, username=username)
+        user = await async_crud.get_user(db, username=username)
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -70,15 +69,15 @@ async def refresh_access_token(token: str, db: Session = Depends(get_db)):
 @router.post("/users/", response_model=schemas.User)
 async def create_user(
     user: schemas.UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    db_user = crud.get_user(db, username=user.username)
+    db_user = await async_crud.get_user(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered",
         )
-    user = crud.create_user(db=db, user=user)
+    user = await async_crud.create_user(db=db, user=user)
 
     # Generate activation token
     activation_token_expires = timedelta(minutes=60)  # Set the expiration time
@@ -92,7 +91,7 @@ async def create_user(
 
 
 @router.post("/users/activate/")
-async def activate_user(token: str, db: Session = Depends(get_db)):
+async def activate_user(token: str, db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, auths.SECRET_KEY, algorithms=[auths.ALGORITHM])
         username: str = payload.get("sub")
@@ -104,23 +103,23 @@ async def activate_user(token: str, db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token"
         )
-    user = crud.get_user(db, username=username)
+    user = await async_crud.get_user(db, username=username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
     user.disabled = False
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await principal_cache.invalidate_user(user.username)
     return {"message": "User activated successfully"}
 
 
 @router.post("/users/reset-password/")
 async def reset_password_request(
-    data: schemas.PasswordResetRequest, db: Session = Depends(get_db)
+    data: schemas.PasswordResetRequest, db: AsyncSession = Depends(get_async_db)
 ):
-    user = crud.get_user_by_email(db, email=data.email)
+    user = await async_crud.get_user_by_email(db, email=data.email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
@@ -140,7 +139,7 @@ async def reset_password_request(
 
 @router.post("/users/reset-password/{token}")
 async def reset_password(
-    token: str, data: schemas.PasswordReset, db: Session = Depends(get_db)
+    token: str, data: schemas.PasswordReset, db: AsyncSession = Depends(get_async_db)
 ):
     try:
         payload = jwt.decode(token, auths.SECRET_KEY, algorithms=[auths.ALGORITHM])
@@ -153,22 +152,22 @@ async def reset_password(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid token"
         )
-    user = crud.get_user(db, username=username)
+    user = await async_crud.get_user(db, username=username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
-    hashed_password = auths.get_password_hash(data.new_password)
+    hashed_password = await auths.hash_password(data.new_password)
     user.hashed_password = hashed_password
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await principal_cache.invalidate_user(user.username)
     return {"message": "Password reset successful"}
 
 
 @router.get("/users/me/", response_model=schemas.User)
 async def read_users_me(
-    current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)]
+    current_user: Annotated[schemas.User, Depends(auths.get_current_active_user)],
 ):
     return current_user
 
@@ -176,29 +175,33 @@ async def read_users_me(
 @router.put("/users/me/", response_model=schemas.User)
 async def update_user(
     user_update: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auths.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(auths.get_current_user),
 ):
-    user = crud.update_user(db=db, user=current_user, user_update=user_update)
+    user = await async_crud.update_user(
+        db=db, user=current_user, user_update=user_update
+    )
     return user
 
 
 @router.patch("/users/me/", response_model=schemas.User)
 async def partial_update_user(
     user_patch: schemas.UserPatch,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auths.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.User = Depends(auths.get_current_user),
 ):
     user_update_data = user_patch.dict(exclude_unset=True)
     if not user_update_data:
         raise HTTPException(status_code=400, detail="No fields provided for update")
-    user = crud.update_user(db=db, user=current_user, user_update=user_update_data)
+    user = await async_crud.update_user(
+        db=db, user=current_user, user_update=schemas.UserUpdate(**user_update_data)
+    )
     return user
 
 
 @router.get("/users/", response_model=List[schemas.User])
 async def read_users(
     current_user: Annotated[schemas.User, Depends(auths.get_current_admin_user)],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    return crud.get_users(db)
+    return await async_crud.get_users(db)
@@ -0,0 +1,82 @@
+import os
+import sys
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+# the backend modules import each other as top-level packages
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repositories.scheduler import BatchScheduler  # noqa: E402
+
+VOCAB_SIZE = 128
+
+
+class Tokenizer:
+    eos_token_id = None
+
+    def decode(self, token_ids, skip_special_tokens: bool = False):
+        return "".join(f"{token_id} " for token_id in token_ids)
+
+
+def tiny_llama(num_hidden_layers: int, seed: int = 0, **config):
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=num_hidden_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=512,
+        **config,
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    return model
+
+
+def prompt(length: int, offset: int = 0):
+    return [(offset + 7 * i) % (VOCAB_SIZE - 1) + 1 for i in range(length)]
+
+
+def reference(model, input_ids, max_new_tokens: int):
+    """Hugging Face greedy decoding of one unbatched prompt."""
+    with torch.inference_mode():
+        output = model.generate(
+            torch.tensor([input_ids]),
+            attention_mask=torch.ones((1, len(input_ids)), dtype=torch.long),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            pad_token_id=0,
+        )
+    return output[0, len(input_ids) :].tolist()
+
+
+def greedy(scheduler, input_ids, max_new_tokens: int, **kwargs):
+    stream = scheduler.submit(
+        input_ids, max_new_tokens, temperature=0, do_sample=False, **kwargs
+    )
+    list(stream)
+    return stream.generated_ids
+
+
+@pytest.fixture(scope="session")
+def model():
+    return tiny_llama(num_hidden_layers=2)
+
+
+@pytest.fixture
+def make_scheduler(model):
+    schedulers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("model", model)
+        scheduler = BatchScheduler(tokenizer=Tokenizer(), device="cpu", **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
@@ -0,0 +1,29 @@
+from conftest import prompt, reference
+
+
+def test_cancelled_sequence_is_dropped(model, make_scheduler):
+    scheduler = make_scheduler(max_batch_size=2)
+    cancelled = scheduler.submit(prompt(9), 400, temperature=0, do_sample=False)
+    survivor = scheduler.submit(
+        prompt(13, offset=3), 30, temperature=0, do_sample=False
+    )
+    for _ in cancelled:
+        cancelled.cancel()
+
+    assert cancelled.finished
+    assert len(cancelled.generated_ids) < 400
+    list(survivor)
+    assert survivor.generated_ids == reference(model, prompt(13, offset=3), 30)
+    assert scheduler._active == []
+
+
+def test_cancelled_before_admission_never_runs(make_scheduler):
+    scheduler = make_scheduler(max_batch_size=1)
+    running = scheduler.submit(prompt(8), 40, temperature=0, do_sample=False)
+    waiting = scheduler.submit(prompt(8, offset=1), 40, temperature=0, do_sample=False)
+    waiting.cancel()
+    list(running)
+    list(waiting)
+
+    assert waiting.finished
+    assert waiting.generated_ids == []
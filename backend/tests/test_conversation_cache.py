@@ -0,0 +1,27 @@
+from conftest import greedy, prompt, reference
+from repositories.conversation_cache import ConversationCache
+
+
+def test_conversation_cache_resumes_next_turn(model, make_scheduler):
+    conversation_cache = ConversationCache(max_bytes=1024**2, min_tokens=4)
+    scheduler = make_scheduler(conversation_cache=conversation_cache)
+    first_turn = prompt(15)
+    reply = greedy(scheduler, first_turn, 25, cache_key=1)
+    second_turn = first_turn + reply + prompt(7, offset=4)
+    result = greedy(scheduler, second_turn, 20, cache_key=1)
+
+    assert result == reference(model, second_turn, 20)
+    assert conversation_cache.hits == 1
+
+
+def test_conversation_cache_reuses_common_prefix(model, make_scheduler):
+    conversation_cache = ConversationCache(max_bytes=1024**2, min_tokens=4)
+    scheduler = make_scheduler(conversation_cache=conversation_cache)
+    first_turn = prompt(15)
+    reply = greedy(scheduler, first_turn, 25, cache_key=1)
+    # the stored reply was trimmed, so only part of the cached entry applies
+    second_turn = first_turn + reply[:10] + prompt(7, offset=4)
+    result = greedy(scheduler, second_turn, 20, cache_key=1)
+
+    assert result == reference(model, second_turn, 20)
+    assert conversation_cache.hits == 1
@@ -0,0 +1,13 @@
+from conftest import greedy, prompt, reference
+from repositories.prefix_cache import PrefixCache
+
+
+def test_prefix_cache_hit_matches_generate(model, make_scheduler):
+    prefix_cache = PrefixCache(max_bytes=1024**2, min_tokens=4)
+    scheduler = make_scheduler(prefix_cache=prefix_cache)
+    system = prompt(12)
+    for offset in (1, 2):
+        input_ids = system + prompt(6, offset=offset)
+        result = greedy(scheduler, input_ids, 20, prefix_len=len(system))
+        assert result == reference(model, input_ids, 20)
+    assert prefix_cache.hits == 1
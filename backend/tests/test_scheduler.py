@@ -0,0 +1,22 @@
+import threading
+
+from conftest import greedy, prompt, reference
+
+
+def test_concurrent_submissions_match_generate(model, make_scheduler):
+    scheduler = make_scheduler(max_batch_size=4)
+    prompts = [prompt(5 + 6 * i, offset=i) for i in range(6)]
+    budgets = [12 + 5 * i for i in range(6)]
+    results = [None] * len(prompts)
+
+    def run(index):
+        results[index] = greedy(scheduler, prompts[index], budgets[index])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(prompts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=60)
+
+    for input_ids, budget, result in zip(prompts, budgets, results):
+        assert result == reference(model, input_ids, budget)
@@ -0,0 +1,99 @@
+import pytest
+import torch
+
+from conftest import VOCAB_SIZE, greedy, prompt, reference, tiny_llama
+from repositories.conversation_cache import ConversationCache
+
+
+def sharing_draft(model):
+    """A one-layer draft sharing the model's embeddings, first layer and head."""
+    draft = tiny_llama(
+        num_hidden_layers=1,
+        seed=1,
+        initializer_range=model.config.initializer_range,
+    )
+    draft.model.embed_tokens.load_state_dict(model.model.embed_tokens.state_dict())
+    draft.model.layers[0].load_state_dict(model.model.layers[0].state_dict())
+    draft.model.norm.load_state_dict(model.model.norm.state_dict())
+    draft.lm_head.load_state_dict(model.lm_head.state_dict())
+    return draft
+
+
+@pytest.fixture(scope="module")
+def draft(model):
+    return sharing_draft(model)
+
+
+@pytest.mark.parametrize("num_draft_tokens", [1, 3, 5])
+def test_speculative_matches_plain_greedy(
+    model, draft, make_scheduler, num_draft_tokens
+):
+    plain = make_scheduler()
+    speculative = make_scheduler(draft_model=draft, num_draft_tokens=num_draft_tokens)
+    for input_ids in (prompt(10), prompt(23, offset=5)):
+        expected = greedy(plain, input_ids, 40)
+        assert greedy(speculative, input_ids, 40) == expected
+        assert expected == reference(model, input_ids, 40)
+    assert speculative.draft_accepted > 0
+
+
+def test_identical_draft_accepts_every_proposal(model, make_scheduler):
+    speculative = make_scheduler(draft_model=model, num_draft_tokens=4)
+    input_ids = prompt(17, offset=2)
+
+    assert greedy(speculative, input_ids, 30) == reference(model, input_ids, 30)
+    assert speculative.draft_proposed > 0
+    assert speculative.draft_accepted == speculative.draft_proposed
+
+
+def test_speculative_turn_is_retained_for_the_next(model, draft, make_scheduler):
+    conversation_cache = ConversationCache(max_bytes=1024**2, min_tokens=4)
+    scheduler = make_scheduler(conversation_cache=conversation_cache, draft_model=draft)
+    first_turn = prompt(15)
+    reply = greedy(scheduler, first_turn, 25, cache_key=1)
+    second_turn = first_turn + reply + prompt(7, offset=4)
+    result = greedy(scheduler, second_turn, 20, cache_key=1)
+
+    assert result == reference(model, second_turn, 20)
+    assert conversation_cache.hits == 1
+
+
+def nucleus(probs: torch.Tensor, top_p: float):
+    sorted_probs, sorted_index = probs.sort(dim=-1, descending=True)
+    sorted_probs = sorted_probs.masked_fill(
+        sorted_probs.cumsum(dim=-1) - sorted_probs > top_p, 0.0
+    )
+    probs = torch.zeros_like(probs).scatter(-1, sorted_index, sorted_probs)
+    return probs / probs.sum(dim=-1, keepdim=True)
+
+
+def test_sampled_speculative_keeps_model_distribution(make_scheduler):
+    # larger weights and a small top_p leave a few likely tokens per step,
+    # so 800 samples tell a wrong rejection sampler from sampling noise
+    model = tiny_llama(num_hidden_layers=2, initializer_range=0.2)
+    draft = sharing_draft(model)
+    input_ids, top_p = prompt(6), 0.3
+    with torch.inference_mode():
+        first = model(torch.tensor([input_ids])).logits[0, -1]
+        continuations = torch.tensor(
+            [input_ids + [token] for token in range(VOCAB_SIZE)]
+        )
+        second = model(continuations).logits[:, -1]
+    # the second token is the first one speculation decides
+    expected = nucleus(first.softmax(-1), top_p) @ nucleus(second.softmax(-1), top_p)
+
+    torch.manual_seed(0)
+    scheduler = make_scheduler(model=model, draft_model=draft, num_draft_tokens=1)
+    runs = 800
+    counts = torch.zeros(VOCAB_SIZE)
+    for _ in range(runs):
+        stream = scheduler.submit(
+            input_ids, 3, temperature=1.0, top_p=top_p, do_sample=True
+        )
+        list(stream)
+        counts[stream.generated_ids[1]] += 1
+
+    assert 0 < scheduler.draft_accepted < scheduler.draft_proposed
+    # about 0.06 here; resampling rejections from the model's distribution
+    # instead of the residual gives 0.15, keeping every draft token 0.65
+    assert (counts / runs - expected).abs().sum() / 2 < 0.1
@@ -25,6 +25,8 @@ export const request = {
   chat: (data) => api.post("/api/v1/chat", data),
   getChats: ({ user_id, page, pageSize }) =>
     api.get(`/api/v1/chats?user_id=${user_id}&page=${page}&page_size=${pageSize}`),
+  getChatSummaries: ({ user_id, page, pageSize }) =>
+    api.get(`/api/v1/chats/summaries?user_id=${user_id}&page=${page}&page_size=${pageSize}`),
   getChatMessages: ({ chatId, page, pageSize }) =>
     api.get(`/api/v1/chats/${chatId}/messages?page=${page}&page_size=${pageSize}`),
 
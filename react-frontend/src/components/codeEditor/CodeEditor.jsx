@@ -10,10 +10,12 @@ import "ace-builds/src-noconflict/ext-error_marker";
 import "ace-builds/src-noconflict/ext-language_tools";
 import "ace-builds/src-noconflict/snippets/python";
 import { CopyToClipboard } from "react-copy-to-clipboard";
-import { request } from "../../../services/api";
+import Cookies from "universal-cookie";
 import toastHandler from "../../helpers/Toasthandler";
 import { FaMoon, FaSun } from "react-icons/fa";
 
+const cookies = new Cookies();
+
 const FORBIDDEN_KEYWORDS = [
   "open",
   "os.",
@@ -66,14 +68,71 @@ const CodeEditor = () => {
       return;
     }
 
+    setOutput("");
+    setError("");
     try {
-      const response = await request.execute_code({ code });
-      setOutput(response.data.result || response.data.error);
-      setError("");
+      const token = cookies.get("access");
+      const res = await fetch(
+        `${import.meta.env.VITE_API_BASE_URL}/api/v1/execute_code/stream`,
+        {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: `Bearer ${token}`,
+          },
+          body: JSON.stringify({ code }),
+        }
+      );
+
+      if (!res.ok) {
+        const data = await res.json();
+        toastHandler(data.detail || "An error occurred", "error");
+        setOutput(data.detail || res.statusText);
+        return;
+      }
+
+      // Server-sent events: "output" chunks, then one "exit" or "error" event
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        events.forEach(handleEvent);
+      }
     } catch (error) {
       setOutput(error.message);
       console.log("Error message: ", error.message);
-      setError("");
+    }
+  };
+
+  const handleEvent = (rawEvent) => {
+    let event = "message";
+    let data = "";
+    for (const line of rawEvent.split("\n")) {
+      if (line.startsWith("event: ")) {
+        event = line.slice(7);
+      } else if (line.startsWith("data: ")) {
+        data += line.slice(6);
+      }
+    }
+    const payload = JSON.parse(data);
+
+    if (event === "output") {
+      setOutput((prev) => prev + payload.data);
+    } else if (event === "exit") {
+      if (payload.timed_out) {
+        setOutput((prev) => prev + "\nError: Code execution timed out.");
+      } else if (payload.returncode !== 0) {
+        setOutput((prev) => prev + `\n[exited with code ${payload.returncode}]`);
+      }
+    } else if (event === "error") {
+      setOutput((prev) => prev + `\nError: ${payload.detail}`);
     }
   };
 
@@ -31,7 +31,7 @@ const ChatHistory = ({ chatId }) => {
     const fetchChats = async () => {
       setLoading(true);
       try {
-        const response = await request.getChats({
+        const response = await request.getChatSummaries({
           user_id: chatId,
           page,
           pageSize,
@@ -154,7 +154,7 @@ const ChatHistory = ({ chatId }) => {
                 onClick={() => handleChatSelect(chat.id)}
                 className="clickable"
               >
-                Chat ID: {chat.id}
+                {chat.title || `Chat ID: ${chat.id}`}
               </Col>
               <Col className="text-end">
                 <Button